@@ -12,7 +12,7 @@ sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'posture_project.settings')
 django.setup()
 
-from posture_stream.models import PostureLog
+from posture_stream.models import AngleSketch, PostureLog
 from django.utils import timezone
 
 def create_sample_data():
@@ -82,6 +82,8 @@ def create_sample_data():
                 duration=duration
             )
     
+    AngleSketch.rebuild_from_logs()
+    
     total_count = PostureLog.objects.count()
     print(f"Successfully created {total_count} posture log entries!")
     
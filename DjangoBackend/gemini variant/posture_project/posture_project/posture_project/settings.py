@@ -142,3 +142,49 @@ CORS_ALLOWED_ORIGINS = [
 ]
 
 CORS_ALLOW_CREDENTIALS = True
+
+# Posture stream configuration
+# Run pose inference on a padded, downscaled crop around the previous
+# frame's landmarks instead of the full webcam frame
+POSTURE_ROI_ENABLED = False
+POSTURE_ROI_PADDING = 0.25
+POSTURE_ROI_MAX_SIDE = 480
+
+# Frame encoder: 'opencv' (JPEG), 'turbojpeg' (needs PyTurboJPEG), 'webp',
+# or 'auto' to use libjpeg-turbo when it is installed
+POSTURE_ENCODER = 'opencv'
+POSTURE_ENCODER_QUALITY = 95
+POSTURE_ENCODER_SUBSAMPLING = '420'
+POSTURE_ENCODER_WORKERS = 2
+
+# Video stream mode (needs PyAV), opted into per connection with
+# ws/posture/?mode=video&codec=vp8. Clients must play it with Media Source
+# Extensions, so the default stays one JPEG per frame. At full 720p, H.264
+# costs about 3x and VP8 about 6x the CPU of MJPEG per frame. Downscaling to
+# POSTURE_VIDEO_MAX_SIDE brings H.264 back to roughly MJPEG cost
+# (None encodes at full size)
+POSTURE_VIDEO_CODEC = 'h264'
+POSTURE_VIDEO_BITRATE = 800000
+POSTURE_VIDEO_FRAGMENT_MS = 100
+POSTURE_VIDEO_MAX_SIDE = 640
+
+# PostureLog retention, applied by `manage.py compact_posture_logs`
+# Logs older than COMPACT_AFTER_DAYS are merged into hourly runs and logs
+# older than RETENTION_DAYS are deleted (None keeps them forever)
+POSTURE_LOG_COMPACT_AFTER_DAYS = 7
+POSTURE_LOG_RETENTION_DAYS = 365
+POSTURE_LOG_COMPACT_BATCH_SIZE = 500
+
+# Streaming admission control (per server process)
+# New sessions past POSTURE_MAX_SESSIONS are refused. While process CPU
+# (percent of one core like top, averaged over the last POSTURE_CPU_WINDOW
+# seconds) is above POSTURE_CPU_BUDGET, new sessions are either refused or
+# streamed at POSTURE_DEGRADED_FPS ('reject' / 'degrade'). Pose inference
+# runs on the single event loop thread, so about 100 means it is saturated;
+# encoder threads can push the reading above 100
+POSTURE_MAX_SESSIONS = 4
+POSTURE_CPU_BUDGET = 80
+POSTURE_CPU_WINDOW = 5
+POSTURE_CPU_OVERLOAD_ACTION = 'degrade'
+POSTURE_STREAM_FPS = 30
+POSTURE_DEGRADED_FPS = 10
@@ -0,0 +1,189 @@
+"""
+Per-process admission control for streaming sessions
+
+Every WebSocket consumer asks the controller for a slot before it opens
+the camera. Sessions past POSTURE_MAX_SESSIONS are rejected, and while the
+process is over its CPU budget new sessions are either rejected or
+admitted at a reduced frame rate, depending on POSTURE_CPU_OVERLOAD_ACTION.
+
+CPU usage is sampled on a background thread every ``sample_interval``
+seconds and averaged over the last ``cpu_window`` seconds, so a reading
+reflects recent load no matter how rarely sessions connect. It is
+reported like top: percent of one core, so a saturated event loop reads
+about 100 and encoder threads can push it higher. Pose inference runs on
+the event loop thread, so one busy core is the real limit regardless of
+how many cores the host has.
+"""
+import os
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+FULL = 'full'
+DEGRADED = 'degraded'
+REJECTED = 'rejected'
+
+OVERLOAD_ACTIONS = ('degrade', 'reject')
+
+
+class Session:
+    """A streaming session admitted by the controller"""
+
+    def __init__(self, session_id, mode, fps):
+        self.session_id = session_id
+        self.mode = mode
+        self.fps = fps
+        self.started_at = time.time()
+        self.frames = 0
+
+    @property
+    def frame_interval(self):
+        return 1 / self.fps
+
+    def as_dict(self):
+        uptime = time.time() - self.started_at
+        return {
+            'id': self.session_id,
+            'mode': self.mode,
+            'targetFps': self.fps,
+            'actualFps': round(self.frames / uptime, 1) if uptime > 0 else 0,
+            'frames': self.frames,
+            'uptime': round(uptime, 1),
+        }
+
+
+class AdmissionController:
+    """Tracks live sessions and process CPU usage to decide who may stream"""
+
+    def __init__(self, max_sessions=4, cpu_budget=80, overload_action='degrade',
+                 fps=30, degraded_fps=10, sample_interval=0.5, cpu_window=5):
+        if overload_action not in OVERLOAD_ACTIONS:
+            raise ImproperlyConfigured(
+                f"POSTURE_CPU_OVERLOAD_ACTION must be one of {', '.join(OVERLOAD_ACTIONS)}"
+            )
+        self.max_sessions = max_sessions
+        self.cpu_budget = cpu_budget
+        self.overload_action = overload_action
+        self.fps = fps
+        self.degraded_fps = degraded_fps
+        self.sample_interval = sample_interval
+        self.cpu_window = cpu_window
+        self.sessions = {}
+        self.rejected_total = 0
+        self._lock = threading.Lock()
+        # (wall clock, process CPU time) pairs covering the last cpu_window seconds
+        self._samples = deque([(time.monotonic(), time.process_time())])
+        self._cpu_percent = 0.0
+        self._sampler = None
+        self._stopped = threading.Event()
+
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            max_sessions=getattr(settings, 'POSTURE_MAX_SESSIONS', 4),
+            cpu_budget=getattr(settings, 'POSTURE_CPU_BUDGET', 80),
+            overload_action=getattr(settings, 'POSTURE_CPU_OVERLOAD_ACTION', 'degrade'),
+            fps=getattr(settings, 'POSTURE_STREAM_FPS', 30),
+            degraded_fps=getattr(settings, 'POSTURE_DEGRADED_FPS', 10),
+            cpu_window=getattr(settings, 'POSTURE_CPU_WINDOW', 5)
+        )
+
+    def sample(self):
+        """Record the process CPU time and update the sliding-window average"""
+        now = time.monotonic()
+        cpu = time.process_time()
+        with self._lock:
+            self._samples.append((now, cpu))
+            # Drop samples once the next one alone still spans the window
+            while len(self._samples) > 2 and now - self._samples[1][0] >= self.cpu_window:
+                self._samples.popleft()
+            first_wall, first_cpu = self._samples[0]
+            if now > first_wall:
+                self._cpu_percent = (cpu - first_cpu) / (now - first_wall) * 100
+
+    def _run_sampler(self):
+        while not self._stopped.wait(self.sample_interval):
+            self.sample()
+
+    def start(self):
+        """Start sampling CPU usage on a background thread"""
+        with self._lock:
+            if self._sampler is not None:
+                return
+            self._stopped.clear()
+            self._sampler = threading.Thread(
+                target=self._run_sampler, name='posture-cpu-sampler', daemon=True
+            )
+            self._sampler.start()
+
+    def stop(self):
+        with self._lock:
+            sampler, self._sampler = self._sampler, None
+        if sampler is not None:
+            self._stopped.set()
+            sampler.join()
+
+    def cpu_percent(self):
+        """Process CPU usage as a percentage of one core over the last cpu_window seconds"""
+        with self._lock:
+            return self._cpu_percent
+
+    def admit(self, session_id):
+        """Return a Session for session_id, or None if it was rejected"""
+        cpu = self.cpu_percent()
+        with self._lock:
+            if session_id in self.sessions:
+                return self.sessions[session_id]
+
+            if len(self.sessions) >= self.max_sessions:
+                self.rejected_total += 1
+                return None
+
+            mode, fps = FULL, self.fps
+            if self.cpu_budget is not None and cpu > self.cpu_budget:
+                if self.overload_action == 'reject':
+                    self.rejected_total += 1
+                    return None
+                mode, fps = DEGRADED, self.degraded_fps
+
+            session = Session(session_id, mode, fps)
+            self.sessions[session_id] = session
+            return session
+
+    def release(self, session_id):
+        with self._lock:
+            self.sessions.pop(session_id, None)
+
+    def metrics(self):
+        cpu = self.cpu_percent()
+        with self._lock:
+            sessions = [session.as_dict() for session in self.sessions.values()]
+            rejected_total = self.rejected_total
+        return {
+            'sessions': len(sessions),
+            'maxSessions': self.max_sessions,
+            'degradedSessions': sum(1 for s in sessions if s['mode'] == DEGRADED),
+            'rejectedTotal': rejected_total,
+            'cpuPercent': round(cpu, 1),
+            'cpuBudget': self.cpu_budget,
+            'overloadAction': self.overload_action,
+            'pid': os.getpid(),
+            'activeSessions': sessions,
+        }
+
+
+_controller = None
+_controller_lock = threading.Lock()
+
+
+def get_admission_controller():
+    """Return the process-wide admission controller, creating it from settings on first use"""
+    global _controller
+    with _controller_lock:
+        if _controller is None:
+            _controller = AdmissionController.from_settings()
+            _controller.start()
+        return _controller
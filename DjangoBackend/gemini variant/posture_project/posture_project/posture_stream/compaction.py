@@ -0,0 +1,131 @@
+"""
+Retention and compaction for PostureLog history
+
+Old runs of adjacent logs with the same status are merged into a single
+row per hour, and rows past the retention horizon are deleted. Work is
+done in small transactions so the live consumer is never blocked for long.
+The one-time switch to incremental auto-vacuum is kept separate because
+it rewrites the whole SQLite file.
+Merged rows keep the summed duration, a segment-weighted angle and the
+number of original segments, so dashboard totals stay the same.
+"""
+from django.db import connection, transaction
+from django.db.models import Q
+
+from .models import AngleSketch, PostureLog
+
+
+def _hour(timestamp):
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+
+def _merge_run(run):
+    """Collapse a run of logs into its first row, returning the number of rows removed"""
+    if len(run) < 2:
+        return 0
+    first = run[0]
+    segments = sum(log.segments for log in run)
+    first.angle = sum(log.angle * log.segments for log in run) / segments
+    first.duration = sum(log.duration for log in run)
+    first.segments = segments
+    first.save(update_fields=['angle', 'duration', 'segments'])
+    PostureLog.objects.filter(id__in=[log.id for log in run[1:]]).delete()
+    return len(run) - 1
+
+
+def compact_logs(before, batch_size=500):
+    """
+    Merge adjacent same-status logs older than ``before`` within each hour.
+    Returns (rows_merged_away, rows_scanned).
+    """
+    removed = 0
+    scanned = 0
+    run = []
+    last = None
+    while True:
+        logs = PostureLog.objects.filter(timestamp__lt=before).order_by('timestamp', 'id')
+        if last is not None:
+            logs = logs.filter(
+                Q(timestamp__gt=last.timestamp) | Q(timestamp=last.timestamp, id__gt=last.id)
+            )
+        batch = list(logs[:batch_size])
+        if not batch:
+            break
+
+        # The open run at the end of a batch carries over into the next one
+        with transaction.atomic():
+            for log in batch:
+                if run and (log.posture_status != run[0].posture_status
+                            or _hour(log.timestamp) != _hour(run[0].timestamp)):
+                    removed += _merge_run(run)
+                    run = []
+                run.append(log)
+        scanned += len(batch)
+        last = batch[-1]
+
+    with transaction.atomic():
+        removed += _merge_run(run)
+    return removed, scanned
+
+
+def purge_logs(before, batch_size=500):
+    """Delete logs and angle sketches older than ``before``, returning the number of logs deleted"""
+    deleted = 0
+    while True:
+        ids = list(
+            PostureLog.objects.filter(timestamp__lt=before)
+            .order_by('timestamp')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            break
+        with transaction.atomic():
+            deleted += PostureLog.objects.filter(id__in=ids).delete()[0]
+
+    AngleSketch.objects.filter(bucket_start__lt=_hour(before)).delete()
+    return deleted
+
+
+def incremental_vacuum_enabled():
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA auto_vacuum')
+        return cursor.fetchone()[0] == 2
+
+
+def enable_incremental_vacuum():
+    """
+    Switch a SQLite database to incremental auto-vacuum. This needs one full
+    VACUUM, which rewrites the file under an exclusive lock, so run it once
+    while the server is stopped. Returns a short description of what was done.
+    """
+    if connection.vendor != 'sqlite':
+        return f"skipped, {connection.vendor} reclaims space itself"
+    if incremental_vacuum_enabled():
+        return "incremental auto-vacuum already enabled"
+
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        cursor.execute('VACUUM')
+    return "enabled incremental auto-vacuum (full VACUUM)"
+
+
+def incremental_vacuum(pages=None):
+    """
+    Return free pages to the filesystem on SQLite without blocking writers
+    for long. Does nothing until enable_incremental_vacuum() has been run.
+    Returns a short description of what was done.
+    """
+    if connection.vendor != 'sqlite':
+        return f"skipped, {connection.vendor} reclaims space itself"
+    if not incremental_vacuum_enabled():
+        return "skipped, incremental auto-vacuum is not enabled (see --enable-incremental-vacuum)"
+
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA freelist_count')
+        free_pages = cursor.fetchone()[0]
+        if pages:
+            cursor.execute(f'PRAGMA incremental_vacuum({int(pages)})')
+        else:
+            cursor.execute('PRAGMA incremental_vacuum')
+        cursor.fetchall()
+        return f"released up to {pages or free_pages} of {free_pages} free pages"
@@ -5,39 +5,86 @@ import numpy as np
 import base64
 import asyncio
 import time
+from urllib.parse import parse_qs
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
-from .models import PostureLog
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from .admission import get_admission_controller
+from .encoders import EncoderPool, VideoStreamEncoder, get_encoder
+from .models import AngleSketch, PostureLog
+from .vision import PoseDetector, calculate_angle, hip_points
 from django.utils import timezone
 
 class PostureConsumer(AsyncWebsocketConsumer):
     async def connect(self):
         await self.accept()
+        self.process_task = None
         
-        # Initialize MediaPipe Pose
-        self.mp_pose = mp.solutions.pose
-        self.pose = self.mp_pose.Pose(
-            min_detection_confidence=0.5,
-            min_tracking_confidence=0.5
-        )
-        self.mp_drawing = mp.solutions.drawing_utils
+        # Ask for a slot before opening the camera
+        self.admission = get_admission_controller()
+        self.session = self.admission.admit(self.channel_name)
+        if self.session is None:
+            await self.send(text_data=json.dumps({
+                'error': 'Server is at capacity, try again later'
+            }))
+            # 1013: Try Again Later
+            await self.close(code=1013)
+            return
+        
+        try:
+            # Initialize MediaPipe Pose
+            self.mp_pose = mp.solutions.pose
+            self.pose = PoseDetector(
+                roi_enabled=getattr(settings, 'POSTURE_ROI_ENABLED', False),
+                roi_padding=getattr(settings, 'POSTURE_ROI_PADDING', 0.25),
+                roi_max_side=getattr(settings, 'POSTURE_ROI_MAX_SIDE', 480),
+                min_detection_confidence=0.5,
+                min_tracking_confidence=0.5
+            )
+            self.mp_drawing = mp.solutions.drawing_utils
+        
+            # Initialize frame encoder
+            self.encoder = self.create_encoder()
+            # Inter-frame encoders keep state between frames, so they get a single worker
+            workers = 1 if self.encoder.streaming else getattr(settings, 'POSTURE_ENCODER_WORKERS', 2)
+            self.encoder_pool = EncoderPool(self.encoder, workers=workers)
+            # Video bytes encoded after a stop, sent ahead of the next chunk
+            self.carry_over = b''
+        
+            # Initialize webcam capture
+            self.cap = cv2.VideoCapture(0)
+            self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
+            self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
         
-        # Initialize webcam capture
-        self.cap = cv2.VideoCapture(0)
-        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
-        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
+            # Initialize tracking variables for database logging
+            self.last_posture_status = None
+            self.posture_start_time = None
+            self.last_save_time = time.time()
+        except Exception:
+            # Channels never calls disconnect when connect raises, so free the slot here
+            self.admission.release(self.channel_name)
+            self.session = None
+            if hasattr(self, 'pose'):
+                self.pose.close()
+            raise
         
-        # Initialize tracking variables for database logging
-        self.last_posture_status = None
-        self.posture_start_time = None
-        self.last_save_time = time.time()
+        await self.send(text_data=json.dumps({
+            'status': 'admitted',
+            'mode': self.session.mode,
+            'fps': self.session.fps
+        }))
         
         # Start processing
-        self.is_running = True
-        asyncio.create_task(self.process_video())
+        await self.start_processing()
 
     async def disconnect(self, close_code):
-        self.is_running = False
+        if getattr(self, 'session', None) is None:
+            return
+        await self.stop_processing()
+        self.admission.release(self.channel_name)
+        
         # Save final posture data before disconnecting
         if self.last_posture_status and self.posture_start_time:
             duration = int(time.time() - self.posture_start_time)
@@ -48,17 +95,47 @@ class PostureConsumer(AsyncWebsocketConsumer):
             self.cap.release()
         if hasattr(self, 'pose'):
             self.pose.close()
+        if hasattr(self, 'encoder_pool'):
+            self.encoder_pool.shutdown()
     
+    def create_encoder(self):
+        """Build the frame encoder for the stream mode requested by the client"""
+        query = parse_qs(self.scope.get('query_string', b'').decode())
+        # Video mode needs an MSE-capable client, so it is never the default
+        mode = query.get('mode', ['mjpeg'])[0]
+        
+        if mode == 'video':
+            try:
+                return VideoStreamEncoder(
+                    codec=query.get('codec', [getattr(settings, 'POSTURE_VIDEO_CODEC', 'h264')])[0],
+                    bitrate=getattr(settings, 'POSTURE_VIDEO_BITRATE', 800000),
+                    # Match the session's rate so keyframes stay keyframe_interval seconds apart
+                    fps=self.session.fps,
+                    fragment_ms=getattr(settings, 'POSTURE_VIDEO_FRAGMENT_MS', 100),
+                    max_side=getattr(settings, 'POSTURE_VIDEO_MAX_SIDE', 640)
+                )
+            except ImproperlyConfigured as e:
+                print(f"Video stream mode unavailable, falling back to mjpeg: {e}")
+        
+        return get_encoder(
+            backend=getattr(settings, 'POSTURE_ENCODER', 'opencv'),
+            quality=getattr(settings, 'POSTURE_ENCODER_QUALITY', 95),
+            subsampling=getattr(settings, 'POSTURE_ENCODER_SUBSAMPLING', '420')
+        )
+
     @database_sync_to_async
     def save_posture_log(self, posture_status, angle, duration):
         """Save posture data to database"""
         try:
-            PostureLog.objects.create(
-                posture_status='good' if posture_status == 'Good Posture' else 'bad',
-                angle=angle,
-                duration=duration,
-                timestamp=timezone.now()
-            )
+            # Keep the log and its hourly sketch in step
+            with transaction.atomic():
+                log = PostureLog.objects.create(
+                    posture_status='good' if posture_status == 'Good Posture' else 'bad',
+                    angle=angle,
+                    duration=duration,
+                    timestamp=timezone.now()
+                )
+                AngleSketch.record(log.timestamp, log.angle)
         except Exception as e:
             print(f"Error saving posture log: {e}")
 
@@ -68,31 +145,81 @@ class PostureConsumer(AsyncWebsocketConsumer):
         command = data.get('command')
         
         if command == 'stop':
-            self.is_running = False
+            await self.stop_processing()
         elif command == 'start':
-            self.is_running = True
-            asyncio.create_task(self.process_video())
+            await self.start_processing()
 
-    def calculate_angle(self, a, b, c):
-        """Calculate angle between three points"""
-        a = np.array(a)
-        b = np.array(b)
-        c = np.array(c)
-        
-        ba = a - b
-        bc = c - b
-        
-        cosine_angle = np.dot(ba, bc) / (np.linalg.norm(ba) * np.linalg.norm(bc))
-        angle = np.arccos(cosine_angle)
-        angle_degrees = np.degrees(angle)
-        
-        if angle_degrees > 180.0:
-            angle_degrees = 360 - angle_degrees
-            
-        return angle_degrees
+    async def start_processing(self):
+        """Start the capture loop unless it is already running"""
+        if self.process_task is not None and not self.process_task.done():
+            return
+        self.is_running = True
+        self.process_task = asyncio.create_task(self.process_video())
+
+    async def stop_processing(self):
+        """Stop the capture loop and wait for it to finish its current frame"""
+        task = self.process_task
+        if task is None:
+            return
+        self.process_task = None
+        self.is_running = False
+        try:
+            # Give the loop a moment to exit cleanly, then cancel it
+            await asyncio.wait_for(task, timeout=1)
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            if not task.cancelled():
+                raise
+        except Exception as e:
+            print(f"Error in video processing: {e}")
+        # Runs after the loop exits or is cancelled mid-frame
+        await self.release_pending_frame()
+
+    async def release_pending_frame(self):
+        """Deal with the last encoded frame the capture loop did not send"""
+        pending, self.pending_frame = getattr(self, 'pending_frame', None), None
+        if pending is None:
+            return
+        if self.encoder.streaming:
+            # Dropping a chunk would corrupt the byte stream, so keep it for a restart
+            self.carry_over += await pending[0]
+        else:
+            pending[0].cancel()
+
+    async def send_frame(self, encoding, posture_data):
+        """Wait for an encoded frame and send it with its posture data"""
+        if self.encoder.streaming:
+            # Video bytes stay in carry_over until they are sent, so a stop
+            # that cancels this frame keeps them for the next start
+            try:
+                # Shielded so cancelling the loop doesn't discard the encode
+                self.carry_over += await asyncio.shield(encoding)
+            except asyncio.CancelledError:
+                self.carry_over += await encoding
+                raise
+            # Video chunks go out as binary messages, posture data as text on the side
+            if self.carry_over:
+                await self.send(bytes_data=self.carry_over)
+                self.carry_over = b''
+            await self.send(text_data=json.dumps({
+                'format': self.encoder.mime_type,
+                'posture': posture_data['posture'],
+                'angle': posture_data['angle']
+            }))
+            return
+        buffer = await encoding
+        await self.send(text_data=json.dumps({
+            'frame': base64.b64encode(buffer).decode('utf-8'),
+            'format': self.encoder.mime_type,
+            'posture': posture_data['posture'],
+            'angle': posture_data['angle']
+        }))
 
     async def process_video(self):
         """Process video frames and send to frontend"""
+        # Frame whose encode is still running while the next frame is processed
+        self.pending_frame = None
         while self.is_running:
             success, image = self.cap.read()
             
@@ -121,22 +248,11 @@ class PostureConsumer(AsyncWebsocketConsumer):
                 if results.pose_landmarks:
                     landmarks = results.pose_landmarks.landmark
                     
-                    # Get coordinates
-                    shoulder = [
-                        landmarks[self.mp_pose.PoseLandmark.LEFT_SHOULDER.value].x,
-                        landmarks[self.mp_pose.PoseLandmark.LEFT_SHOULDER.value].y
-                    ]
-                    hip = [
-                        landmarks[self.mp_pose.PoseLandmark.LEFT_HIP.value].x,
-                        landmarks[self.mp_pose.PoseLandmark.LEFT_HIP.value].y
-                    ]
-                    knee = [
-                        landmarks[self.mp_pose.PoseLandmark.LEFT_KNEE.value].x,
-                        landmarks[self.mp_pose.PoseLandmark.LEFT_KNEE.value].y
-                    ]
+                    # Get coordinates (full-frame, even when inference ran on a crop)
+                    shoulder, hip, knee = hip_points(landmarks)
                     
                     # Calculate angle
-                    angle = self.calculate_angle(shoulder, hip, knee)
+                    angle = calculate_angle(shoulder, hip, knee)
                     hip_pixel = tuple(np.multiply(hip, [image_width, image_height]).astype(int))
                     
                     # Determine posture
@@ -198,16 +314,15 @@ class PostureConsumer(AsyncWebsocketConsumer):
             except Exception as e:
                 pass
             
-            # Encode image to base64
-            _, buffer = cv2.imencode('.jpg', image)
-            jpg_as_text = base64.b64encode(buffer).decode('utf-8')
+            # Encode on the thread pool so it overlaps with the next frame's inference
+            encoding = self.encoder_pool.submit(image)
             
-            # Send frame to frontend
-            await self.send(text_data=json.dumps({
-                'frame': jpg_as_text,
-                'posture': posture_data['posture'],
-                'angle': posture_data['angle']
-            }))
+            # Send the previous frame to frontend
+            sending, self.pending_frame = self.pending_frame, (encoding, posture_data)
+            if sending is not None:
+                await self.send_frame(*sending)
+            
+            self.session.frames += 1
             
-            # Control frame rate (~30 FPS)
-            await asyncio.sleep(0.033)
\ No newline at end of file
+            # Control frame rate (~30 FPS, lower for degraded sessions)
+            await asyncio.sleep(self.session.frame_interval)
\ No newline at end of file
@@ -0,0 +1,305 @@
+"""
+Frame encoder backends for the video stream
+
+Every backend takes an annotated BGR frame and returns the encoded image
+bytes. ``get_encoder`` builds one from the POSTURE_ENCODER settings, and
+``EncoderPool`` runs encodes on worker threads so the consumer can start
+inference on the next frame while the previous one is being compressed.
+
+``VideoStreamEncoder`` is the stateful inter-frame alternative: it feeds
+frames to H.264 or VP8 through PyAV and returns fragmented MP4 / WebM
+chunks instead of one image per frame.
+"""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from fractions import Fraction
+
+import cv2
+from django.core.exceptions import ImproperlyConfigured
+
+try:
+    from turbojpeg import TurboJPEG, TJPF_BGR, TJSAMP_420, TJSAMP_422, TJSAMP_444
+except ImportError:
+    TurboJPEG = None
+
+try:
+    import av
+except ImportError:
+    av = None
+
+SUBSAMPLING_CHOICES = ('420', '422', '444')
+
+
+class FrameEncoder:
+    """Base class for frame encoders"""
+    name = None
+    mime_type = None
+    # Streaming encoders return container chunks rather than standalone images
+    streaming = False
+
+    def __init__(self, quality=95, subsampling='420'):
+        if not 1 <= quality <= 100:
+            raise ImproperlyConfigured(f"Encoder quality must be between 1 and 100, got {quality}")
+        if subsampling not in SUBSAMPLING_CHOICES:
+            raise ImproperlyConfigured(
+                f"Chroma subsampling must be one of {', '.join(SUBSAMPLING_CHOICES)}, got {subsampling}"
+            )
+        self.quality = quality
+        self.subsampling = subsampling
+
+    def encode(self, image):
+        """Encode a BGR frame and return the image bytes"""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def __str__(self):
+        return f"{self.name} q={self.quality} {self.subsampling}"
+
+
+class OpenCVJpegEncoder(FrameEncoder):
+    """JPEG through cv2.imencode"""
+    name = 'opencv'
+    mime_type = 'image/jpeg'
+
+    SAMPLING_FACTORS = {
+        '420': 'IMWRITE_JPEG_SAMPLING_FACTOR_420',
+        '422': 'IMWRITE_JPEG_SAMPLING_FACTOR_422',
+        '444': 'IMWRITE_JPEG_SAMPLING_FACTOR_444',
+    }
+
+    def __init__(self, quality=95, subsampling='420'):
+        super().__init__(quality, subsampling)
+        self.params = [int(cv2.IMWRITE_JPEG_QUALITY), quality]
+        # Sampling factor control needs OpenCV 4.5.5+, older builds always use 4:2:0
+        factor = getattr(cv2, self.SAMPLING_FACTORS[subsampling], None)
+        if factor is not None:
+            self.params += [int(cv2.IMWRITE_JPEG_SAMPLING_FACTOR), int(factor)]
+
+    def encode(self, image):
+        success, buffer = cv2.imencode('.jpg', image, self.params)
+        if not success:
+            raise RuntimeError("JPEG encoding failed")
+        return buffer.tobytes()
+
+
+class TurboJpegEncoder(FrameEncoder):
+    """JPEG through libjpeg-turbo via PyTurboJPEG"""
+    name = 'turbojpeg'
+    mime_type = 'image/jpeg'
+
+    def __init__(self, quality=95, subsampling='420'):
+        super().__init__(quality, subsampling)
+        if TurboJPEG is None:
+            raise ImproperlyConfigured("The turbojpeg encoder requires PyTurboJPEG to be installed")
+        try:
+            self.jpeg = TurboJPEG()
+        except (OSError, RuntimeError) as e:
+            raise ImproperlyConfigured(f"Could not load libjpeg-turbo: {e}")
+        self.jpeg_subsample = {'420': TJSAMP_420, '422': TJSAMP_422, '444': TJSAMP_444}[subsampling]
+
+    def encode(self, image):
+        return self.jpeg.encode(
+            image,
+            quality=self.quality,
+            pixel_format=TJPF_BGR,
+            jpeg_subsample=self.jpeg_subsample
+        )
+
+
+class WebPEncoder(FrameEncoder):
+    """Lossy WebP through cv2.imencode (always 4:2:0, subsampling is ignored)"""
+    name = 'webp'
+    mime_type = 'image/webp'
+
+    def __init__(self, quality=95, subsampling='420'):
+        super().__init__(quality, subsampling)
+        self.params = [int(cv2.IMWRITE_WEBP_QUALITY), quality]
+
+    def encode(self, image):
+        success, buffer = cv2.imencode('.webp', image, self.params)
+        if not success:
+            raise RuntimeError("WebP encoding failed")
+        return buffer.tobytes()
+
+
+class _ChunkSink:
+    """Write-only file object that collects muxer output until drained"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+class VideoStreamEncoder:
+    """
+    Inter-frame encoder producing a fragmented MP4 (H.264) or WebM (VP8)
+    byte stream. The first chunk carries the initialization segment, so a
+    client must receive every chunk from the start of the session.
+    Not thread safe: run it on a single worker.
+
+    Frames larger than ``max_side`` are downscaled before encoding, which
+    cuts the encoder's CPU cost roughly in proportion to the pixel count.
+    """
+    streaming = True
+
+    CODECS = {
+        'h264': {
+            'codec': 'libx264',
+            'format': 'mp4',
+            'mime_type': 'video/mp4; codecs="avc1.42E01F"',
+            'options': {'preset': 'ultrafast', 'tune': 'zerolatency', 'profile': 'baseline'},
+        },
+        'vp8': {
+            'codec': 'libvpx',
+            'format': 'webm',
+            'mime_type': 'video/webm; codecs="vp8"',
+            'options': {'deadline': 'realtime', 'cpu-used': '8', 'lag-in-frames': '0'},
+        },
+    }
+
+    def __init__(self, codec='h264', bitrate=800000, fps=30, keyframe_interval=2, fragment_ms=100,
+                 max_side=None):
+        if av is None:
+            raise ImproperlyConfigured("The video stream mode requires PyAV to be installed")
+        if codec not in self.CODECS:
+            raise ImproperlyConfigured(
+                f"Unknown video codec {codec!r}, expected one of {', '.join(self.CODECS)}"
+            )
+        self.name = codec
+        self.config = self.CODECS[codec]
+        self.mime_type = self.config['mime_type']
+        self.bitrate = bitrate
+        self.fps = fps
+        self.keyframe_interval = keyframe_interval
+        self.fragment_ms = fragment_ms
+        self.max_side = max_side
+        self.size = None
+        self.container = None
+        self.stream = None
+        self.sink = _ChunkSink()
+        self.start_time = None
+        self.last_pts = -1
+
+    def _open(self, width, height):
+        # Push each muxed packet straight to the sink instead of buffering
+        container_options = {'flush_packets': '1'}
+        if self.config['format'] == 'mp4':
+            container_options.update({
+                'movflags': 'empty_moov+default_base_moof+frag_keyframe',
+                'frag_duration': str(self.fragment_ms * 1000),
+            })
+        else:
+            container_options['cluster_time_limit'] = str(self.fragment_ms)
+        self.container = av.open(
+            self.sink, mode='w', format=self.config['format'],
+            container_options=container_options
+        )
+        self.stream = self.container.add_stream(self.config['codec'], rate=self.fps)
+        self.stream.width = width
+        self.stream.height = height
+        self.stream.pix_fmt = 'yuv420p'
+        self.stream.bit_rate = self.bitrate
+        self.stream.options = dict(self.config['options'])
+        self.stream.codec_context.gop_size = self.fps * self.keyframe_interval
+        # Frames arrive at a variable rate, so timestamp them in milliseconds
+        self.stream.codec_context.time_base = Fraction(1, 1000)
+        self.start_time = time.monotonic()
+
+    def encode(self, image, timestamp_ms=None):
+        """
+        Encode a BGR frame and return whatever container bytes are ready (may be empty).
+        Frames are stamped with wall-clock time unless timestamp_ms is given.
+        """
+        if self.container is None:
+            height, width = image.shape[:2]
+            scale = min(1, self.max_side / max(height, width)) if self.max_side else 1
+            # yuv420p needs even dimensions
+            self.size = (max(2, int(width * scale) // 2 * 2), max(2, int(height * scale) // 2 * 2))
+            self._open(*self.size)
+
+        if image.shape[1::-1] != self.size:
+            image = cv2.resize(image, self.size, interpolation=cv2.INTER_AREA)
+
+        if timestamp_ms is None:
+            timestamp_ms = int((time.monotonic() - self.start_time) * 1000)
+        pts = max(timestamp_ms, self.last_pts + 1)
+        self.last_pts = pts
+        frame = av.VideoFrame.from_ndarray(image, format='bgr24')
+        frame.pts = pts
+        frame.time_base = Fraction(1, 1000)
+        for packet in self.stream.encode(frame):
+            self.container.mux(packet)
+        return self.sink.drain()
+
+    def close(self):
+        """Flush the encoder and return the trailing bytes"""
+        if self.container is None:
+            return b''
+        for packet in self.stream.encode():
+            self.container.mux(packet)
+        self.container.close()
+        self.container = None
+        return self.sink.drain()
+
+    def __str__(self):
+        if self.max_side:
+            return f"{self.name} {self.bitrate // 1000}kbps {self.max_side}px"
+        return f"{self.name} {self.bitrate // 1000}kbps"
+
+
+ENCODERS = {
+    encoder.name: encoder
+    for encoder in (OpenCVJpegEncoder, TurboJpegEncoder, WebPEncoder)
+}
+
+
+def turbojpeg_available():
+    return TurboJPEG is not None
+
+
+def get_encoder(backend='opencv', quality=95, subsampling='420'):
+    """
+    Build an encoder by name. 'auto' picks libjpeg-turbo when it can be
+    loaded and falls back to OpenCV JPEG otherwise.
+    """
+    if backend == 'auto':
+        if turbojpeg_available():
+            try:
+                return TurboJpegEncoder(quality, subsampling)
+            except ImproperlyConfigured:
+                pass
+        backend = 'opencv'
+    if backend not in ENCODERS:
+        raise ImproperlyConfigured(
+            f"Unknown encoder backend {backend!r}, expected one of auto, {', '.join(ENCODERS)}"
+        )
+    return ENCODERS[backend](quality, subsampling)
+
+
+class EncoderPool:
+    """Runs an encoder on a small thread pool (cv2 and libjpeg-turbo release the GIL)"""
+
+    def __init__(self, encoder, workers=2):
+        self.encoder = encoder
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='frame-encoder')
+
+    def submit(self, image):
+        """Start encoding a frame and return an awaitable for its bytes"""
+        loop = asyncio.get_running_loop()
+        return loop.run_in_executor(self.executor, self.encoder.encode, image)
+
+    def shutdown(self):
+        # Close on the worker so it runs after any encode still in flight
+        self.executor.submit(self.encoder.close)
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,89 @@
+"""
+Benchmark frame encoder backends at different quality and subsampling settings
+
+Usage:
+    python manage.py benchmark_encoders --clip clip.mp4 --qualities 60,80,95
+    python manage.py benchmark_encoders --camera 0 --frames 100
+"""
+import time
+
+import cv2
+import numpy as np
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+
+from posture_stream.encoders import ENCODERS, SUBSAMPLING_CHOICES, get_encoder
+
+
+def comma_list(value):
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+class Command(BaseCommand):
+    help = 'Report ms per frame and bytes per frame for each encoder setting'
+
+    def add_arguments(self, parser):
+        source = parser.add_mutually_exclusive_group()
+        source.add_argument('--clip', help='Recorded video file to read frames from')
+        source.add_argument('--camera', type=int, default=0, help='Webcam index (default 0)')
+        parser.add_argument('--frames', type=int, default=100, help='Number of frames to encode')
+        parser.add_argument('--backends', type=comma_list, default=list(ENCODERS))
+        parser.add_argument('--qualities', type=comma_list, default=['60', '80', '95'])
+        parser.add_argument('--subsampling', type=comma_list, default=list(SUBSAMPLING_CHOICES))
+
+    def load_frames(self, options):
+        cap = cv2.VideoCapture(options['clip'] if options['clip'] else options['camera'])
+        if not options['clip']:
+            cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
+            cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
+        frames = []
+        try:
+            while len(frames) < options['frames']:
+                success, image = cap.read()
+                if not success:
+                    break
+                frames.append(image)
+        finally:
+            cap.release()
+        if not frames:
+            raise CommandError("No frames could be read from the source")
+        return frames
+
+    def handle(self, *args, **options):
+        frames = self.load_frames(options)
+        height, width = frames[0].shape[:2]
+        self.stdout.write(f"{len(frames)} frames at {width}x{height}")
+        self.stdout.write(f"{'backend':<10} {'quality':>7} {'chroma':>6} {'ms/frame':>9} {'p95 ms':>7} {'bytes/frame':>12}")
+
+        for backend in options['backends']:
+            try:
+                get_encoder(backend)
+            except ImproperlyConfigured as e:
+                self.stdout.write(self.style.WARNING(f"{backend:<10} skipped: {e}"))
+                continue
+            for subsampling in options['subsampling']:
+                # WebP is always 4:2:0, so only run it once
+                if backend == 'webp' and subsampling != '420':
+                    continue
+                for quality in options['qualities']:
+                    try:
+                        encoder = get_encoder(backend, int(quality), subsampling)
+                    except (ImproperlyConfigured, ValueError) as e:
+                        raise CommandError(str(e))
+                    self.report(encoder, frames)
+
+    def report(self, encoder, frames):
+        # Warm up so one-time allocation doesn't skew the numbers
+        encoder.encode(frames[0])
+        timings = []
+        sizes = []
+        for image in frames:
+            start = time.perf_counter()
+            data = encoder.encode(image)
+            timings.append((time.perf_counter() - start) * 1000)
+            sizes.append(len(data))
+        timings = np.array(timings)
+        self.stdout.write(
+            f"{encoder.name:<10} {encoder.quality:>7} {encoder.subsampling:>6} "
+            f"{timings.mean():>9.2f} {np.percentile(timings, 95):>7.2f} {int(np.mean(sizes)):>12}"
+        )
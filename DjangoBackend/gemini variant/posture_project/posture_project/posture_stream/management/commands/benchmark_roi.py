@@ -0,0 +1,104 @@
+"""
+Compare region-of-interest inference against full-frame inference on recorded clips
+
+Usage:
+    python manage.py benchmark_roi clip1.mp4 clip2.mp4 --max-side 480
+"""
+import time
+
+import cv2
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from posture_stream.vision import PoseDetector, calculate_angle, hip_points
+
+
+class Command(BaseCommand):
+    help = 'Report inference time and angle accuracy of ROI inference against full-frame inference'
+
+    def add_arguments(self, parser):
+        parser.add_argument('clips', nargs='+', help='Recorded video files to replay')
+        parser.add_argument('--padding', type=float,
+                            default=getattr(settings, 'POSTURE_ROI_PADDING', 0.25))
+        parser.add_argument('--max-side', type=int,
+                            default=getattr(settings, 'POSTURE_ROI_MAX_SIDE', 480))
+        parser.add_argument('--max-frames', type=int, default=0,
+                            help='Stop after this many frames per clip (0 = whole clip)')
+
+    def handle(self, *args, **options):
+        for path in options['clips']:
+            cap = cv2.VideoCapture(path)
+            if not cap.isOpened():
+                raise CommandError(f"Could not open {path}")
+            try:
+                stats = self.run_clip(cap, options)
+            finally:
+                cap.release()
+            self.report(path, stats)
+
+    def run_clip(self, cap, options):
+        full = PoseDetector(roi_enabled=False)
+        roi = PoseDetector(roi_enabled=True, roi_padding=options['padding'],
+                           roi_max_side=options['max_side'])
+        stats = {
+            'frames': 0,
+            'full_ms': [],
+            'roi_ms': [],
+            'roi_frames': 0,
+            'angle_errors': [],
+            'missed': 0,
+            'crop_resets': 0,
+        }
+        try:
+            while True:
+                success, image = cap.read()
+                if not success:
+                    break
+                if options['max_frames'] and stats['frames'] >= options['max_frames']:
+                    break
+                stats['frames'] += 1
+                image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+                start = time.perf_counter()
+                full_results = full.process(image_rgb)
+                stats['full_ms'].append((time.perf_counter() - start) * 1000)
+
+                start = time.perf_counter()
+                roi_results = roi.process(image_rgb)
+                stats['roi_ms'].append((time.perf_counter() - start) * 1000)
+                if roi.used_roi:
+                    stats['roi_frames'] += 1
+                stats['crop_resets'] = roi.crop_resets
+
+                if not full_results.pose_landmarks:
+                    continue
+                if not roi_results.pose_landmarks:
+                    stats['missed'] += 1
+                    continue
+                full_angle = calculate_angle(*hip_points(full_results.pose_landmarks.landmark))
+                roi_angle = calculate_angle(*hip_points(roi_results.pose_landmarks.landmark))
+                stats['angle_errors'].append(abs(full_angle - roi_angle))
+        finally:
+            full.close()
+            roi.close()
+        return stats
+
+    def report(self, path, stats):
+        self.stdout.write(self.style.MIGRATE_HEADING(path))
+        if not stats['frames']:
+            self.stdout.write('  no frames decoded')
+            return
+
+        full_ms = np.array(stats['full_ms'])
+        roi_ms = np.array(stats['roi_ms'])
+        self.stdout.write(f"  frames:            {stats['frames']} "
+                          f"({stats['roi_frames']} cropped, {stats['missed']} missed by ROI, "
+                          f"{stats['crop_resets']} crop resets)")
+        self.stdout.write(f"  full-frame ms:     mean {full_ms.mean():.1f}  p95 {np.percentile(full_ms, 95):.1f}")
+        self.stdout.write(f"  ROI ms:            mean {roi_ms.mean():.1f}  p95 {np.percentile(roi_ms, 95):.1f}")
+        self.stdout.write(f"  speedup:           {full_ms.mean() / roi_ms.mean():.2f}x")
+        if stats['angle_errors']:
+            errors = np.array(stats['angle_errors'])
+            self.stdout.write(f"  angle error (deg): mean {errors.mean():.2f}  "
+                              f"p95 {np.percentile(errors, 95):.2f}  max {errors.max():.2f}")
@@ -0,0 +1,94 @@
+"""
+Compare bandwidth and CPU cost of the video stream mode against MJPEG
+
+Usage:
+    python manage.py benchmark_stream clip.mp4 --codecs h264,vp8 --bitrate 800000 --max-side 640
+"""
+import base64
+import time
+
+import cv2
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+
+from posture_stream.encoders import VideoStreamEncoder, get_encoder
+
+
+def comma_list(value):
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+class Command(BaseCommand):
+    help = 'Report bytes on the wire and CPU time per frame for MJPEG and inter-frame video streaming'
+
+    def add_arguments(self, parser):
+        parser.add_argument('clip', help='Recorded video file to replay')
+        parser.add_argument('--frames', type=int, default=300, help='Maximum frames to encode')
+        parser.add_argument('--fps', type=int, default=30, help='Frame rate the stream is replayed at')
+        parser.add_argument('--codecs', type=comma_list, default=list(VideoStreamEncoder.CODECS))
+        parser.add_argument('--bitrate', type=int,
+                            default=getattr(settings, 'POSTURE_VIDEO_BITRATE', 800000))
+        parser.add_argument('--max-side', type=int,
+                            default=getattr(settings, 'POSTURE_VIDEO_MAX_SIDE', None),
+                            help='Downscale video frames to this many pixels on the longer side (0 = full size)')
+
+    def handle(self, *args, **options):
+        frames = self.load_frames(options['clip'], options['frames'])
+        fps = options['fps']
+        seconds = len(frames) / fps
+        self.stdout.write(f"{len(frames)} frames ({seconds:.1f}s at {fps} fps)")
+        self.stdout.write(f"{'mode':<26} {'kbit/s':>9} {'bytes/frame':>12} {'cpu ms/frame':>13} {'vs mjpeg':>9}")
+
+        jpeg = get_encoder(
+            backend=getattr(settings, 'POSTURE_ENCODER', 'opencv'),
+            quality=getattr(settings, 'POSTURE_ENCODER_QUALITY', 95),
+            subsampling=getattr(settings, 'POSTURE_ENCODER_SUBSAMPLING', '420')
+        )
+        # MJPEG frames travel base64 encoded inside JSON, so count that size
+        baseline = self.measure(frames, lambda image, i: base64.b64encode(jpeg.encode(image)))
+        self.report(f"mjpeg ({jpeg.name})", baseline, len(frames), seconds, baseline[0])
+
+        for codec in options['codecs']:
+            try:
+                encoder = VideoStreamEncoder(codec=codec, bitrate=options['bitrate'], fps=fps,
+                                             max_side=options['max_side'])
+            except ImproperlyConfigured as e:
+                self.stdout.write(self.style.WARNING(f"{codec:<26} skipped: {e}"))
+                continue
+            result = self.measure(frames, lambda image, i: encoder.encode(image, timestamp_ms=i * 1000 // fps))
+            trailer = len(encoder.close())
+            total = (result[0] + trailer, result[1])
+            self.report(f"video ({encoder})", total, len(frames), seconds, baseline[0])
+
+    def load_frames(self, path, limit):
+        cap = cv2.VideoCapture(path)
+        if not cap.isOpened():
+            raise CommandError(f"Could not open {path}")
+        frames = []
+        try:
+            while len(frames) < limit:
+                success, image = cap.read()
+                if not success:
+                    break
+                frames.append(image)
+        finally:
+            cap.release()
+        if not frames:
+            raise CommandError(f"No frames could be read from {path}")
+        return frames
+
+    def measure(self, frames, encode):
+        """Return total bytes produced and total CPU seconds spent encoding"""
+        total_bytes = 0
+        start = time.process_time()
+        for i, image in enumerate(frames):
+            total_bytes += len(encode(image, i))
+        return total_bytes, time.process_time() - start
+
+    def report(self, label, result, frame_count, seconds, baseline_bytes):
+        total_bytes, cpu_seconds = result
+        self.stdout.write(
+            f"{label:<26} {total_bytes * 8 / seconds / 1000:>9.0f} {total_bytes // frame_count:>12} "
+            f"{cpu_seconds * 1000 / frame_count:>13.2f} {baseline_bytes / total_bytes:>8.1f}x"
+        )
@@ -0,0 +1,62 @@
+"""
+Compact old posture logs, delete logs past the retention horizon and reclaim space
+
+Run it from cron, e.g. nightly:
+    0 3 * * * cd /path/to/project && python manage.py compact_posture_logs
+
+On SQLite, enable incremental vacuum once while the server is stopped:
+    python manage.py compact_posture_logs --enable-incremental-vacuum
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from posture_stream.compaction import (
+    compact_logs, enable_incremental_vacuum, incremental_vacuum, purge_logs
+)
+
+
+class Command(BaseCommand):
+    help = 'Merge old same-status posture logs, purge expired ones and vacuum the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--compact-after-days', type=int,
+                            default=getattr(settings, 'POSTURE_LOG_COMPACT_AFTER_DAYS', 7))
+        parser.add_argument('--retention-days', type=int,
+                            default=getattr(settings, 'POSTURE_LOG_RETENTION_DAYS', None))
+        parser.add_argument('--batch-size', type=int,
+                            default=getattr(settings, 'POSTURE_LOG_COMPACT_BATCH_SIZE', 500))
+        parser.add_argument('--vacuum-pages', type=int, default=None,
+                            help='Limit how many free pages one run releases (default: all)')
+        parser.add_argument('--no-vacuum', action='store_true', help='Skip reclaiming space')
+        parser.add_argument('--enable-incremental-vacuum', action='store_true',
+                            help='Switch SQLite to incremental auto-vacuum with one full VACUUM, '
+                                 'which locks the database; run it once with the server stopped')
+
+    def handle(self, *args, **options):
+        # Today's dashboard groups by minute, so never compact the current day
+        if options['compact_after_days'] < 1:
+            raise CommandError("--compact-after-days must be at least 1")
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size must be at least 1")
+
+        if options['enable_incremental_vacuum']:
+            self.stdout.write(f"Vacuum: {enable_incremental_vacuum()}")
+
+        now = timezone.now()
+        retention_days = options['retention_days']
+        if retention_days is not None:
+            deleted = purge_logs(now - timedelta(days=retention_days), options['batch_size'])
+            self.stdout.write(f"Deleted {deleted} logs older than {retention_days} days")
+
+        removed, scanned = compact_logs(
+            now - timedelta(days=options['compact_after_days']), options['batch_size']
+        )
+        self.stdout.write(f"Merged away {removed} of {scanned} logs older than "
+                          f"{options['compact_after_days']} days")
+
+        if not options['no_vacuum']:
+            self.stdout.write(f"Vacuum: {incremental_vacuum(options['vacuum_pages'])}")
+        self.stdout.write(self.style.SUCCESS("Compaction complete"))
@@ -0,0 +1,17 @@
+"""
+Rebuild the hourly angle sketches from the PostureLog table
+
+Usage:
+    python manage.py rebuild_angle_sketches
+"""
+from django.core.management.base import BaseCommand
+
+from posture_stream.models import AngleSketch
+
+
+class Command(BaseCommand):
+    help = 'Recreate hourly angle sketches from existing posture logs'
+
+    def handle(self, *args, **options):
+        buckets = AngleSketch.rebuild_from_logs()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {buckets} angle sketch buckets"))
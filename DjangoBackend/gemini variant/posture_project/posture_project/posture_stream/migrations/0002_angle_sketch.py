@@ -0,0 +1,24 @@
+# Generated by Django 5.2.9 on 2026-10-19 09:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posture_stream', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AngleSketch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket_start', models.DateTimeField(unique=True)),
+                ('sketch', models.JSONField(help_text="Serialized DDSketch of the bucket's angles")),
+            ],
+            options={
+                'ordering': ['bucket_start'],
+            },
+        ),
+    ]
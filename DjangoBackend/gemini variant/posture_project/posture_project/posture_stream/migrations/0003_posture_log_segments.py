@@ -0,0 +1,18 @@
+# Generated by Django 5.2.9 on 2026-10-19 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posture_stream', '0002_angle_sketch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='posturelog',
+            name='segments',
+            field=models.IntegerField(default=1, help_text='Number of logged segments merged into this row'),
+        ),
+    ]
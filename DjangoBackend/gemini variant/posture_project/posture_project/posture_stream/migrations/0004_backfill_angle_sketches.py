@@ -0,0 +1,21 @@
+# Generated by Django 5.2.9 on 2026-10-19 10:00
+
+from django.db import migrations
+
+
+def backfill_angle_sketches(apps, schema_editor):
+    """Build hourly sketches for posture logs recorded before sketches existed"""
+    from posture_stream.models import rebuild_angle_sketches
+    rebuild_angle_sketches(apps.get_model('posture_stream', 'PostureLog'),
+                           apps.get_model('posture_stream', 'AngleSketch'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posture_stream', '0003_posture_log_segments'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_angle_sketches, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,6 @@
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone
+from .sketches import DDSketch
 
 class PostureLog(models.Model):
     """Store posture monitoring data"""
@@ -12,6 +13,7 @@ class PostureLog(models.Model):
     posture_status = models.CharField(max_length=10, choices=POSTURE_CHOICES)
     angle = models.FloatField(help_text="Hip angle in degrees")
     duration = models.IntegerField(default=0, help_text="Duration in seconds")
+    segments = models.IntegerField(default=1, help_text="Number of logged segments merged into this row")
     
     class Meta:
         ordering = ['-timestamp']
@@ -22,3 +24,59 @@ class PostureLog(models.Model):
     
     def __str__(self):
         return f"{self.posture_status} - {self.angle}° at {self.timestamp}"
+
+
+class AngleSketch(models.Model):
+    """Hourly quantile sketch of posture angles, merged at query time"""
+    bucket_start = models.DateTimeField(unique=True)
+    sketch = models.JSONField(help_text="Serialized DDSketch of the bucket's angles")
+    
+    class Meta:
+        ordering = ['bucket_start']
+    
+    def __str__(self):
+        return f"Angle sketch for {self.bucket_start}"
+    
+    @staticmethod
+    def bucket_for(timestamp):
+        """Return the start of the hourly bucket containing timestamp"""
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    
+    @classmethod
+    def record(cls, timestamp, angle):
+        """Add one posture log's angle to the bucket covering timestamp"""
+        with transaction.atomic():
+            bucket, created = cls.objects.select_for_update().get_or_create(
+                bucket_start=cls.bucket_for(timestamp),
+                defaults={'sketch': DDSketch().to_dict()}
+            )
+            sketch = DDSketch.from_dict(bucket.sketch)
+            sketch.add(angle)
+            bucket.sketch = sketch.to_dict()
+            bucket.save(update_fields=['sketch'])
+    
+    @classmethod
+    def rebuild_from_logs(cls):
+        """Recreate every bucket from the PostureLog table, returning the bucket count"""
+        return rebuild_angle_sketches(PostureLog, cls)
+
+
+def rebuild_angle_sketches(log_model, sketch_model):
+    """
+    Replace every sketch bucket with one built from the posture logs.
+    Takes the model classes so data migrations can pass historical models.
+    """
+    sketches = {}
+    logs = log_model.objects.order_by('timestamp').values_list('timestamp', 'angle', 'segments')
+    for timestamp, angle, segments in logs.iterator():
+        bucket = AngleSketch.bucket_for(timestamp)
+        # A compacted row stands in for several original readings
+        sketches.setdefault(bucket, DDSketch()).add(angle, weight=segments)
+    
+    with transaction.atomic():
+        sketch_model.objects.all().delete()
+        sketch_model.objects.bulk_create(
+            sketch_model(bucket_start=bucket, sketch=sketch.to_dict())
+            for bucket, sketch in sketches.items()
+        )
+    return len(sketches)
@@ -0,0 +1,134 @@
+"""
+Mergeable quantile sketch for posture angle analytics
+
+A small DDSketch implementation: values are counted in logarithmically
+sized bins so every quantile estimate is within ``relative_accuracy`` of
+the true value, sketches of different time buckets merge by adding bin
+counts, and the size stays bounded no matter how many values are added.
+"""
+import math
+from bisect import bisect_right
+
+
+class DDSketch:
+    """Quantile sketch with relative-error guarantees over positive values"""
+
+    def __init__(self, relative_accuracy=0.01, max_bins=512):
+        self.relative_accuracy = relative_accuracy
+        self.max_bins = max_bins
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.bins = {}
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def _index(self, value):
+        return math.ceil(math.log(value) / self._log_gamma)
+
+    def _value(self, index):
+        # Midpoint of the bin (gamma^(i-1), gamma^i] in the relative-error sense
+        return 2 * self.gamma ** index / (self.gamma + 1)
+
+    def add(self, value, weight=1):
+        """Add a value to the sketch"""
+        if value <= 0:
+            self.zero_count += weight
+        else:
+            index = self._index(value)
+            self.bins[index] = self.bins.get(index, 0) + weight
+            self._collapse()
+        self.count += weight
+        self.sum += value * weight
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, other):
+        """Merge another sketch with the same accuracy into this one"""
+        if other.gamma != self.gamma:
+            raise ValueError("Cannot merge sketches with different relative accuracy")
+        for index, count in other.bins.items():
+            self.bins[index] = self.bins.get(index, 0) + count
+        self._collapse()
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.sum += other.sum
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+
+    def _collapse(self):
+        # Fold the lowest bins together so the sketch never exceeds max_bins
+        while len(self.bins) > self.max_bins:
+            lowest, second = sorted(self.bins)[:2]
+            self.bins[second] += self.bins.pop(lowest)
+
+    def quantile(self, q):
+        """Return the estimated value at quantile q (0..1), or None if empty"""
+        if self.count == 0:
+            return None
+        if q <= 0:
+            return self.min
+        if q >= 1:
+            return self.max
+
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if seen > rank:
+                return min(max(self._value(index), self.min), self.max)
+        return self.max
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else None
+
+    def histogram(self, edges):
+        """
+        Return approximate counts between consecutive ``edges``.
+        Each sketch bin is assigned to the interval containing its value.
+        """
+        counts = [0] * (len(edges) - 1)
+        values = [(0.0, self.zero_count)] + [
+            (self._value(index), count) for index, count in self.bins.items()
+        ]
+        for value, count in values:
+            if not count:
+                continue
+            i = bisect_right(edges, value) - 1
+            # The last interval is closed on the right
+            if i == len(counts) and value == edges[-1]:
+                i -= 1
+            if 0 <= i < len(counts):
+                counts[i] += count
+        return counts
+
+    def to_dict(self):
+        """Compact JSON-serializable representation"""
+        indexes = sorted(self.bins)
+        return {
+            'a': self.relative_accuracy,
+            'k': indexes,
+            'c': [self.bins[index] for index in indexes],
+            'z': self.zero_count,
+            'n': self.count,
+            's': self.sum,
+            'lo': self.min,
+            'hi': self.max,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(relative_accuracy=data['a'])
+        sketch.bins = dict(zip(data['k'], data['c']))
+        sketch.zero_count = data['z']
+        sketch.count = data['n']
+        sketch.sum = data['s']
+        sketch.min = data['lo']
+        sketch.max = data['hi']
+        return sketch
@@ -1,3 +1,734 @@
-from django.test import TestCase
+import asyncio
+import random
+import time
+from datetime import timedelta
+from importlib import import_module
+from types import SimpleNamespace
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import cv2
+import numpy as np
+from channels.testing import WebsocketCommunicator
+from django.apps import apps as django_apps
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.db.models import Sum
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from . import encoders
+from .admission import DEGRADED, FULL, AdmissionController, Session
+from .encoders import OpenCVJpegEncoder, VideoStreamEncoder, WebPEncoder, get_encoder
+from .compaction import (
+    compact_logs, enable_incremental_vacuum, incremental_vacuum, incremental_vacuum_enabled, purge_logs
+)
+from .consumers import PostureConsumer
+from .models import AngleSketch, PostureLog
+from .sketches import DDSketch
+from .vision import PoseDetector, landmarks_bbox, remap_landmarks
+
+
+class DDSketchTests(TestCase):
+    def setUp(self):
+        rng = random.Random(42)
+        self.values = [rng.uniform(60, 130) for _ in range(2000)]
+
+    def exact_quantile(self, values, q):
+        ordered = sorted(values)
+        return ordered[int(q * (len(ordered) - 1))]
+
+    def test_quantiles_within_relative_accuracy(self):
+        sketch = DDSketch(relative_accuracy=0.01)
+        for value in self.values:
+            sketch.add(value)
+
+        for q in (0.1, 0.5, 0.9, 0.99):
+            exact = self.exact_quantile(self.values, q)
+            self.assertAlmostEqual(sketch.quantile(q), exact, delta=exact * 0.01)
+        self.assertEqual(sketch.count, len(self.values))
+        self.assertAlmostEqual(sketch.mean, sum(self.values) / len(self.values))
+
+    def test_merge_matches_single_sketch(self):
+        whole = DDSketch()
+        first, second = DDSketch(), DDSketch()
+        for i, value in enumerate(self.values):
+            whole.add(value)
+            (first if i % 2 else second).add(value)
+
+        first.merge(second)
+        self.assertEqual(first.bins, whole.bins)
+        self.assertEqual(first.count, whole.count)
+        self.assertEqual((first.min, first.max), (whole.min, whole.max))
+        self.assertAlmostEqual(first.sum, whole.sum)
+        self.assertEqual(first.quantile(0.5), whole.quantile(0.5))
+
+    def test_size_is_bounded(self):
+        sketch = DDSketch(max_bins=32)
+        for value in self.values:
+            sketch.add(value)
+        self.assertLessEqual(len(sketch.bins), 32)
+        self.assertEqual(sketch.count, len(self.values))
+
+    def test_round_trip(self):
+        sketch = DDSketch()
+        for value in self.values[:50]:
+            sketch.add(value)
+        restored = DDSketch.from_dict(sketch.to_dict())
+        self.assertEqual(restored.quantile(0.9), sketch.quantile(0.9))
+
+    def test_histogram_counts_every_value(self):
+        sketch = DDSketch()
+        for value in self.values:
+            sketch.add(value)
+        counts = sketch.histogram([0, 90, 180])
+        self.assertEqual(sum(counts), len(self.values))
+        below = sum(1 for value in self.values if value < 90)
+        self.assertAlmostEqual(counts[0], below, delta=len(self.values) * 0.01)
+
+    def test_histogram_edges(self):
+        sketch = DDSketch()
+        for value in (0, 45, 180, 200):
+            sketch.add(value)
+        # 180 closes the last interval, values past the edges are dropped
+        self.assertEqual(sketch.histogram([0, 90, 180]), [2, 1])
+
+    def test_empty_sketch(self):
+        self.assertIsNone(DDSketch().quantile(0.5))
+        self.assertIsNone(DDSketch().mean)
+
+
+class AngleAnalyticsTests(TestCase):
+    def setUp(self):
+        self.now = timezone.now().replace(minute=30, second=0, microsecond=0)
+        self.day_one = self.now - timedelta(days=2)
+        self.day_two = self.now - timedelta(days=1)
+        for angle in (80, 90, 100):
+            AngleSketch.record(self.day_one, angle)
+        for angle in (110, 120):
+            AngleSketch.record(self.day_two, angle)
+            AngleSketch.record(self.day_two + timedelta(hours=1), angle)
+
+    def test_backfill_migration_builds_sketches(self):
+        AngleSketch.objects.all().delete()
+        for angle in (80, 90, 100):
+            PostureLog.objects.create(timestamp=self.day_one, posture_status='bad', angle=angle, duration=30)
+        PostureLog.objects.create(timestamp=self.day_two, posture_status='good', angle=120,
+                                  duration=90, segments=3)
+
+        migration = import_module('posture_stream.migrations.0004_backfill_angle_sketches')
+        migration.backfill_angle_sketches(django_apps, None)
+
+        counts = {bucket.bucket_start: DDSketch.from_dict(bucket.sketch).count
+                  for bucket in AngleSketch.objects.all()}
+        self.assertEqual(counts, {
+            AngleSketch.bucket_for(self.day_one): 3,
+            AngleSketch.bucket_for(self.day_two): 3,
+        })
+
+    def test_record_groups_by_hour(self):
+        self.assertEqual(AngleSketch.objects.count(), 3)
+        bucket = AngleSketch.objects.get(bucket_start=AngleSketch.bucket_for(self.day_one))
+        self.assertEqual(DDSketch.from_dict(bucket.sketch).count, 3)
+
+    def test_daily_percentiles(self):
+        response = self.client.get(reverse('posture_stream:angle_analytics'), {
+            'start': (self.now - timedelta(days=3)).isoformat(),
+            'end': self.now.isoformat(),
+            'granularity': 'day',
+            'percentiles': '50,90',
+        })
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+
+        self.assertEqual(body['overall']['count'], 7)
+        counts = [period['count'] for period in body['data']]
+        self.assertEqual(sum(counts), 7)
+        first = body['data'][0]
+        self.assertAlmostEqual(first['percentiles']['p50'], 90, delta=1)
+        self.assertEqual(sum(b['count'] for b in first['histogram']), first['count'])
+
+    def test_invalid_granularity(self):
+        response = self.client.get(reverse('posture_stream:angle_analytics'), {'granularity': 'year'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_invalid_date(self):
+        response = self.client.get(reverse('posture_stream:angle_analytics'), {'start': 'yesterday'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_invalid_bin_width(self):
+        url = reverse('posture_stream:angle_analytics')
+        for value in ('nan', 'inf', '-1'):
+            self.assertEqual(self.client.get(url, {'bin_width': value}).status_code, 400)
+
+    def test_invalid_percentiles(self):
+        url = reverse('posture_stream:angle_analytics')
+        for value in ('nan', '50,inf', '101'):
+            self.assertEqual(self.client.get(url, {'percentiles': value}).status_code, 400)
+
+    def test_too_many_bins(self):
+        url = reverse('posture_stream:angle_analytics')
+        self.assertEqual(self.client.get(url, {'bin_width': '0.5'}).status_code, 200)
+        self.assertEqual(self.client.get(url, {'bin_width': '0.1'}).status_code, 400)
+
+    def test_too_many_periods(self):
+        response = self.client.get(reverse('posture_stream:angle_analytics'), {
+            'start': (self.now - timedelta(days=365)).isoformat(),
+            'end': self.now.isoformat(),
+            'granularity': 'hour',
+        })
+        self.assertEqual(response.status_code, 400)
+
+
+class FrameEncoderTests(TestCase):
+    def setUp(self):
+        self.image = np.zeros((120, 160, 3), dtype=np.uint8)
+        cv2.rectangle(self.image, (20, 20), (100, 90), (0, 255, 0), -1)
+
+    def test_opencv_jpeg_decodes(self):
+        data = OpenCVJpegEncoder(quality=80, subsampling='444').encode(self.image)
+        self.assertTrue(data.startswith(b'\xff\xd8'))
+        decoded = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        self.assertEqual(decoded.shape, self.image.shape)
+
+    def test_lower_quality_is_smaller(self):
+        noisy = np.random.default_rng(0).integers(0, 255, (120, 160, 3), dtype=np.uint8)
+        high = OpenCVJpegEncoder(quality=95).encode(noisy)
+        low = OpenCVJpegEncoder(quality=40).encode(noisy)
+        self.assertLess(len(low), len(high))
+
+    def test_webp(self):
+        encoder = WebPEncoder(quality=70)
+        data = encoder.encode(self.image)
+        self.assertEqual(data[8:12], b'WEBP')
+        self.assertEqual(encoder.mime_type, 'image/webp')
+
+    def test_get_encoder(self):
+        self.assertIsInstance(get_encoder('opencv', 70, '422'), OpenCVJpegEncoder)
+        self.assertEqual(get_encoder('auto').mime_type, 'image/jpeg')
+        with self.assertRaises(ImproperlyConfigured):
+            get_encoder('png')
+        with self.assertRaises(ImproperlyConfigured):
+            get_encoder('opencv', quality=0)
+        with self.assertRaises(ImproperlyConfigured):
+            get_encoder('opencv', subsampling='411')
+
+
+@skipUnless(encoders.av is not None, "PyAV is not installed")
+class VideoStreamEncoderTests(TestCase):
+    def frames(self, count=30):
+        for i in range(count):
+            image = np.full((144, 176, 3), 90, dtype=np.uint8)
+            cv2.circle(image, (40 + i * 3, 72), 20, (0, 200, 255), -1)
+            yield image
+
+    def test_h264_fragmented_mp4(self):
+        encoder = VideoStreamEncoder('h264', bitrate=200000)
+        chunks = [encoder.encode(image, timestamp_ms=i * 33) for i, image in enumerate(self.frames())]
+        stream = b''.join(chunks) + encoder.close()
+
+        self.assertEqual(chunks[0][4:8], b'ftyp')
+        self.assertIn(b'moof', stream)
+        jpeg = OpenCVJpegEncoder(quality=95)
+        self.assertLess(len(stream), sum(len(jpeg.encode(image)) for image in self.frames()))
+
+    def test_vp8_webm(self):
+        encoder = VideoStreamEncoder('vp8', bitrate=200000)
+        stream = b''.join(encoder.encode(image) for image in self.frames(5)) + encoder.close()
+        self.assertTrue(stream.startswith(b'\x1a\x45\xdf\xa3'))
+
+    def test_max_side_downscales(self):
+        encoder = VideoStreamEncoder('h264', bitrate=200000, max_side=100)
+        for image in self.frames(3):
+            encoder.encode(image)
+        encoder.close()
+        self.assertEqual(encoder.size, (100, 80))
+
+    def test_unknown_codec(self):
+        with self.assertRaises(ImproperlyConfigured):
+            VideoStreamEncoder('mpeg2')
+
+
+class CompactionTests(TestCase):
+    def setUp(self):
+        rng = random.Random(7)
+        self.now = timezone.now()
+        status = 'good'
+        for days_ago in range(2, 7):
+            day = self.now - timedelta(days=days_ago)
+            for hour in (9, 10, 14):
+                for i in range(20):
+                    if rng.random() < 0.2:
+                        status = 'bad' if status == 'good' else 'good'
+                    PostureLog.objects.create(
+                        timestamp=day.replace(hour=hour, minute=i * 3, second=0, microsecond=0),
+                        posture_status=status,
+                        angle=rng.randint(95, 120) if status == 'good' else rng.randint(60, 90),
+                        duration=30
+                    )
+        # Recent logs that must be left alone
+        for i in range(3):
+            PostureLog.objects.create(
+                timestamp=self.now - timedelta(minutes=i + 1),
+                posture_status='good', angle=100, duration=30
+            )
+
+    def dashboard(self):
+        return [
+            self.client.get(reverse(f'posture_stream:{name}')).json()
+            for name in ('dashboard_stats', 'week_data', 'month_data')
+        ]
+
+    def duration_totals(self):
+        totals = {}
+        for log in PostureLog.objects.all():
+            key = (log.timestamp.date(), log.posture_status)
+            totals[key] = totals.get(key, 0) + log.duration
+        return totals
+
+    def test_dashboard_totals_unchanged(self):
+        before_count = PostureLog.objects.count()
+        before = self.dashboard()
+        before_durations = self.duration_totals()
+
+        removed, scanned = compact_logs(self.now - timedelta(hours=12), batch_size=7)
+
+        self.assertGreater(removed, 0)
+        self.assertEqual(scanned, before_count - 3)
+        self.assertEqual(PostureLog.objects.count(), before_count - removed)
+        self.assertEqual(self.dashboard(), before)
+        self.assertEqual(self.duration_totals(), before_durations)
+        self.assertEqual(PostureLog.objects.aggregate(Sum('segments'))['segments__sum'], before_count)
+
+    def test_rebuilt_sketch_counts_unchanged(self):
+        params = {
+            'start': (self.now - timedelta(days=7)).isoformat(),
+            'end': self.now.isoformat(),
+            'granularity': 'hour',
+        }
+
+        def counts():
+            body = self.client.get(reverse('posture_stream:angle_analytics'), params).json()
+            return [(period['period'], period['count']) for period in body['data']]
+
+        AngleSketch.rebuild_from_logs()
+        before = counts()
+        removed, _ = compact_logs(self.now - timedelta(hours=12))
+        AngleSketch.rebuild_from_logs()
+
+        self.assertGreater(removed, 0)
+        self.assertEqual(counts(), before)
+
+    def test_recent_logs_round_merged_angles(self):
+        PostureLog.objects.create(timestamp=self.now, posture_status='good',
+                                  angle=292 / 3, duration=90, segments=3)
+        response = self.client.get(reverse('posture_stream:recent_logs'), {'limit': 1})
+        log = response.json()['data'][0]
+        self.assertEqual(log['angle'], 97.3)
+        self.assertEqual(log['notes'], '97.3° for 90s')
+
+    def test_runs_stay_within_an_hour_and_status(self):
+        compact_logs(self.now - timedelta(hours=12), batch_size=7)
+        logs = list(PostureLog.objects.filter(timestamp__lt=self.now - timedelta(hours=12)).order_by('timestamp'))
+        for previous, log in zip(logs, logs[1:]):
+            same_hour = previous.timestamp.replace(minute=0) == log.timestamp.replace(minute=0)
+            self.assertFalse(same_hour and previous.posture_status == log.posture_status)
+
+    def test_recent_logs_untouched(self):
+        compact_logs(self.now - timedelta(hours=12))
+        recent = PostureLog.objects.filter(timestamp__gte=self.now - timedelta(hours=1))
+        self.assertEqual(recent.count(), 3)
+        self.assertTrue(all(log.segments == 1 for log in recent))
+
+    def test_compaction_is_idempotent(self):
+        compact_logs(self.now - timedelta(hours=12))
+        count = PostureLog.objects.count()
+        self.assertEqual(compact_logs(self.now - timedelta(hours=12))[0], 0)
+        self.assertEqual(PostureLog.objects.count(), count)
+
+    def test_purge(self):
+        horizon = (self.now - timedelta(days=4)).replace(hour=0, minute=0, second=0, microsecond=0)
+        AngleSketch.record(horizon - timedelta(days=1), 100)
+        AngleSketch.record(self.now, 100)
+        deleted = purge_logs(horizon, batch_size=10)
+
+        # Days 5 and 6 ago, three hours of twenty logs each
+        self.assertEqual(deleted, 2 * 3 * 20)
+        self.assertFalse(PostureLog.objects.filter(timestamp__lt=horizon).exists())
+        self.assertEqual(AngleSketch.objects.count(), 1)
+
+
+class VacuumTests(TransactionTestCase):
+    def test_incremental_vacuum(self):
+        # Scheduled runs never convert the database themselves
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA auto_vacuum = NONE')
+            cursor.execute('VACUUM')
+        self.assertIn('not enabled', incremental_vacuum())
+        self.assertFalse(incremental_vacuum_enabled())
+
+        self.assertIn('full VACUUM', enable_incremental_vacuum())
+        self.assertIn('free pages', incremental_vacuum(pages=10))
+        self.assertIn('already enabled', enable_incremental_vacuum())
+
+
+class AdmissionControllerTests(TestCase):
+    def controller(self, cpu=0.0, **kwargs):
+        controller = AdmissionController(**kwargs)
+        controller.cpu_percent = mock.Mock(return_value=cpu)
+        return controller
+
+    def test_rejects_past_max_sessions(self):
+        controller = self.controller(max_sessions=2)
+        self.assertIsNotNone(controller.admit('a'))
+        self.assertIsNotNone(controller.admit('b'))
+        self.assertIsNone(controller.admit('c'))
+        self.assertEqual(controller.metrics()['rejectedTotal'], 1)
+
+        controller.release('a')
+        self.assertIsNotNone(controller.admit('c'))
+
+    def test_admit_is_idempotent(self):
+        controller = self.controller(max_sessions=1)
+        session = controller.admit('a')
+        self.assertIs(controller.admit('a'), session)
+        self.assertEqual(controller.metrics()['sessions'], 1)
+        controller.release('a')
+        controller.release('a')
+        self.assertEqual(controller.metrics()['sessions'], 0)
+
+    def test_degrades_over_cpu_budget(self):
+        controller = self.controller(cpu=95.0, cpu_budget=80, fps=30, degraded_fps=10)
+        session = controller.admit('a')
+        self.assertEqual(session.mode, DEGRADED)
+        self.assertAlmostEqual(session.frame_interval, 0.1)
+        self.assertEqual(controller.metrics()['degradedSessions'], 1)
+
+    def test_rejects_over_cpu_budget(self):
+        controller = self.controller(cpu=95.0, cpu_budget=80, overload_action='reject')
+        self.assertIsNone(controller.admit('a'))
+
+    def test_full_under_cpu_budget(self):
+        session = self.controller(cpu=20.0, cpu_budget=80).admit('a')
+        self.assertEqual(session.mode, FULL)
+        self.assertEqual(session.fps, 30)
+
+    def test_invalid_overload_action(self):
+        with self.assertRaises(ImproperlyConfigured):
+            AdmissionController(overload_action='queue')
+
+    def test_sample_measures_process_time(self):
+        controller = AdmissionController()
+        sum(i * i for i in range(200000))
+        controller.sample()
+        self.assertGreater(controller.cpu_percent(), 0)
+
+    @mock.patch('os.cpu_count', return_value=8)
+    def test_cpu_percent_is_per_core(self, cpu_count):
+        clock = {'wall': 0.0, 'cpu': 0.0}
+        with mock.patch('posture_stream.admission.time.monotonic', lambda: clock['wall']), \
+                mock.patch('posture_stream.admission.time.process_time', lambda: clock['cpu']):
+            controller = AdmissionController(cpu_budget=80)
+            # One saturated event loop thread on an eight-core host
+            for _ in range(10):
+                clock['wall'] += 1
+                clock['cpu'] += 1
+                controller.sample()
+            self.assertAlmostEqual(controller.cpu_percent(), 100)
+            self.assertEqual(controller.admit('a').mode, DEGRADED)
+
+    def test_cpu_percent_uses_sliding_window(self):
+        clock = {'wall': 0.0, 'cpu': 0.0}
+        with mock.patch('posture_stream.admission.time.monotonic', lambda: clock['wall']), \
+                mock.patch('posture_stream.admission.time.process_time', lambda: clock['cpu']):
+            controller = AdmissionController(cpu_window=5)
+            # A minute of full load, then a minute idle
+            for _ in range(60):
+                clock['wall'] += 1
+                clock['cpu'] += 1
+                controller.sample()
+            self.assertAlmostEqual(controller.cpu_percent(), 100)
+            for _ in range(60):
+                clock['wall'] += 1
+                controller.sample()
+            self.assertAlmostEqual(controller.cpu_percent(), 0)
+        self.assertLessEqual(len(controller._samples), 7)
+
+    def test_background_sampler(self):
+        controller = AdmissionController(sample_interval=0.01)
+        controller.start()
+        self.addCleanup(controller.stop)
+        deadline = time.monotonic() + 5
+        while not controller.cpu_percent() and time.monotonic() < deadline:
+            sum(i * i for i in range(20000))
+        self.assertGreater(controller.cpu_percent(), 0)
+        controller.stop()
+        self.assertIsNone(controller._sampler)
+
+    def test_metrics_endpoint(self):
+        response = self.client.get(reverse('posture_stream:stream_metrics'))
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        for key in ('sessions', 'maxSessions', 'cpuPercent', 'cpuBudget', 'activeSessions'):
+            self.assertIn(key, body)
+
+
+def fake_landmarks(points, visibility=1.0):
+    return [SimpleNamespace(x=x, y=y, z=0.0, visibility=visibility) for x, y in points]
+
+
+class RegionOfInterestTests(TestCase):
+    def test_remap_round_trip(self):
+        full = [(0.40, 0.30), (0.45, 0.55), (0.55, 0.80)]
+        bbox = (400, 150, 800, 650)
+        # Express the points relative to the crop, then map them back
+        crop = fake_landmarks([
+            ((x * 1280 - bbox[0]) / (bbox[2] - bbox[0]), (y * 720 - bbox[1]) / (bbox[3] - bbox[1]))
+            for x, y in full
+        ])
+        remap_landmarks(crop, bbox, 1280, 720)
+        for landmark, (x, y) in zip(crop, full):
+            self.assertAlmostEqual(landmark.x, x)
+            self.assertAlmostEqual(landmark.y, y)
+
+    def test_bbox_is_padded(self):
+        bbox = landmarks_bbox(fake_landmarks([(0.4, 0.4), (0.5, 0.6)]), 1000, 1000, padding=0.5)
+        self.assertEqual(bbox, (300, 300, 600, 700))
+
+    def test_bbox_clips_to_image(self):
+        bbox = landmarks_bbox(fake_landmarks([(-0.1, 0.05), (1.05, 0.9)]), 1280, 720, padding=0.25)
+        self.assertEqual(bbox, (0, 0, 1280, 720))
+
+    def test_bbox_ignores_hidden_landmarks(self):
+        landmarks = fake_landmarks([(0.4, 0.4), (0.5, 0.5)]) + fake_landmarks([(0.9, 0.9)], visibility=0.1)
+        x0, y0, x1, y1 = landmarks_bbox(landmarks, 1000, 1000, padding=0)
+        self.assertEqual((x1, y1), (500, 500))
+
+    def test_degenerate_bbox(self):
+        self.assertIsNone(landmarks_bbox(fake_landmarks([(0.5, 0.5), (0.5, 0.5)]), 1280, 720))
+        self.assertIsNone(landmarks_bbox([], 1280, 720))
+
+
+class FakePose:
+    """Stands in for mp_pose.Pose, answering from a per-instance script"""
+    instances = []
+
+    def __init__(self, **kwargs):
+        self.crop = kwargs.get('smooth_landmarks') is False
+        self.inputs = []
+        self.closed = False
+        FakePose.instances.append(self)
+
+    def process(self, image):
+        self.inputs.append(image.shape)
+        points = FakePose.script.pop(0)
+        landmarks = SimpleNamespace(landmark=fake_landmarks(points)) if points else None
+        return SimpleNamespace(pose_landmarks=landmarks)
+
+    def close(self):
+        self.closed = True
+
+
+@mock.patch('posture_stream.vision.mp_pose.Pose', FakePose)
+class PoseDetectorTests(TestCase):
+    BODY = [(0.4, 0.3), (0.5, 0.7)]
+    # The same body as seen inside the padding=0.5 crop taken around it
+    BODY_IN_CROP = [(0.35, 0.25), (0.65, 0.75)]
+
+    def setUp(self):
+        FakePose.instances = []
+        self.image = np.zeros((720, 1280, 3), dtype=np.uint8)
+
+    def test_crop_then_fallback(self):
+        FakePose.script = [self.BODY, self.BODY_IN_CROP, None, self.BODY]
+        detector = PoseDetector(roi_enabled=True, roi_padding=0.5, roi_max_side=200)
+
+        detector.process(self.image)
+        self.assertFalse(detector.used_roi)
+        self.assertIsNotNone(detector.roi)
+
+        roi = detector.roi
+        results = detector.process(self.image)
+        self.assertTrue(detector.used_roi)
+        crop_pose = FakePose.instances[1]
+        self.assertTrue(crop_pose.crop)
+        self.assertLessEqual(max(crop_pose.inputs[0][:2]), 200)
+        # Landmarks come back in full-frame coordinates
+        first = results.pose_landmarks.landmark[0]
+        self.assertAlmostEqual(first.x, (0.35 * (roi[2] - roi[0]) + roi[0]) / 1280)
+
+        # The crop misses, so the same frame is re-run at full resolution
+        results = detector.process(self.image)
+        self.assertFalse(detector.used_roi)
+        self.assertIsNotNone(results.pose_landmarks)
+        self.assertTrue(crop_pose.closed)
+        self.assertEqual(FakePose.instances[0].inputs[-1], self.image.shape)
+
+    def test_crop_is_kept_while_person_stays_inside(self):
+        FakePose.script = [self.BODY] + [self.BODY_IN_CROP] * 5
+        detector = PoseDetector(roi_enabled=True, roi_padding=0.5)
+        detector.process(self.image)
+        roi = detector.roi
+        for _ in range(5):
+            detector.process(self.image)
+        self.assertEqual(detector.roi, roi)
+        self.assertEqual(detector.crop_resets, 1)
+
+    def test_moving_crop_resets_crop_instance(self):
+        FakePose.script = [self.BODY, [(0.0, 0.0), (0.3, 0.3)], self.BODY_IN_CROP]
+        detector = PoseDetector(roi_enabled=True, roi_padding=0.5)
+        detector.process(self.image)
+        roi = detector.roi
+        detector.process(self.image)
+        self.assertNotEqual(detector.roi, roi)
+        self.assertTrue(FakePose.instances[1].closed)
+        detector.process(self.image)
+        self.assertEqual(detector.crop_resets, 2)
+
+    def test_roi_disabled_uses_full_frame(self):
+        FakePose.script = [self.BODY, self.BODY]
+        detector = PoseDetector()
+        detector.process(self.image)
+        detector.process(self.image)
+        self.assertEqual(len(FakePose.instances), 1)
+        self.assertIsNone(detector.roi)
+
+
+class FakeCamera:
+    """Stands in for cv2.VideoCapture, returning blank frames"""
+
+    def __init__(self, index):
+        self.released = False
+
+    def set(self, prop, value):
+        return True
+
+    def read(self):
+        return True, np.zeros((72, 128, 3), dtype=np.uint8)
+
+    def release(self):
+        self.released = True
+
+
+class IdlePose:
+    """Stands in for mp_pose.Pose, never finding a person"""
+
+    def __init__(self, **kwargs):
+        pass
+
+    def process(self, image):
+        return SimpleNamespace(pose_landmarks=None)
+
+    def close(self):
+        pass
+
+
+@mock.patch('posture_stream.vision.mp_pose.Pose', IdlePose)
+@mock.patch('posture_stream.consumers.cv2.VideoCapture', FakeCamera)
+class PostureConsumerTests(TestCase):
+    def setUp(self):
+        self.admission = AdmissionController(max_sessions=1)
+        patcher = mock.patch('posture_stream.consumers.get_admission_controller', return_value=self.admission)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def connect(self):
+        communicator = WebsocketCommunicator(PostureConsumer.as_asgi(), '/ws/posture/')
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    def capture_tasks(self):
+        return [task for task in asyncio.all_tasks() if 'process_video' in repr(task.get_coro())]
+
+    async def test_repeated_start_runs_one_loop(self):
+        communicator = await self.connect()
+        self.assertEqual((await communicator.receive_json_from())['status'], 'admitted')
+        for _ in range(3):
+            await communicator.send_json_to({'command': 'start'})
+        await asyncio.sleep(0.1)
+        self.assertEqual(len(self.capture_tasks()), 1)
+        await communicator.disconnect()
+
+    async def test_stop_finishes_loop(self):
+        communicator = await self.connect()
+        await communicator.receive_json_from()
+        await communicator.receive_json_from(timeout=2)
+        task = self.capture_tasks()[0]
+
+        await communicator.send_json_to({'command': 'stop'})
+        await asyncio.sleep(0.2)
+        self.assertTrue(task.done())
+        self.assertEqual(self.capture_tasks(), [])
+        await communicator.disconnect()
+
+    async def test_disconnect_releases_slot(self):
+        communicator = await self.connect()
+        await communicator.receive_json_from()
+        self.assertEqual(self.admission.metrics()['sessions'], 1)
+        await communicator.disconnect()
+        self.assertEqual(self.admission.metrics()['sessions'], 0)
+
+    async def test_failed_setup_releases_slot(self):
+        # Channels doesn't call disconnect after connect raises
+        with self.settings(POSTURE_ENCODER='turbojpeg'), \
+                mock.patch('posture_stream.encoders.TurboJPEG', None):
+            communicator = await self.connect()
+            # The socket is accepted before setup, so the error surfaces on the next receive
+            with self.assertRaises(ImproperlyConfigured):
+                await communicator.receive_output()
+        self.assertEqual(self.admission.metrics()['sessions'], 0)
+
+        communicator = await self.connect()
+        self.assertEqual((await communicator.receive_json_from())['status'], 'admitted')
+        await communicator.disconnect()
+
+    async def test_rejected_connect_closes_with_1013(self):
+        first = await self.connect()
+        await first.receive_json_from()
+
+        second = await self.connect()
+        self.assertIn('error', await second.receive_json_from())
+        output = await second.receive_output()
+        self.assertEqual(output, {'type': 'websocket.close', 'code': 1013})
+        self.assertEqual(self.admission.metrics()['rejectedTotal'], 1)
+        await first.disconnect()
+
+    @skipUnless(encoders.av is not None, 'PyAV is not installed')
+    def test_video_encoder_uses_session_fps(self):
+        consumer = PostureConsumer()
+        consumer.scope = {'query_string': b'mode=video'}
+        consumer.session = Session('test', DEGRADED, 10)
+        encoder = consumer.create_encoder()
+        encoder.encode(np.zeros((72, 128, 3), dtype=np.uint8))
+        # Two seconds between keyframes at the degraded rate
+        self.assertEqual(encoder.stream.codec_context.gop_size, 20)
+        encoder.close()
+
+    async def test_cancelled_stop_keeps_video_chunks(self):
+        consumer = PostureConsumer()
+        consumer.cap = FakeCamera(0)
+        consumer.pose = PoseDetector()
+        consumer.session = Session('test', FULL, 30)
+        consumer.encoder = SimpleNamespace(streaming=True, mime_type='video/mp4')
+        chunks = iter([b'one', b'two', b'three'])
+
+        def submit(image):
+            encoding = asyncio.get_running_loop().create_future()
+            encoding.set_result(next(chunks))
+            return encoding
+
+        consumer.encoder_pool = SimpleNamespace(submit=submit)
+        consumer.carry_over = b''
+        consumer.process_task = None
+        async def stalled_send(**kwargs):
+            await asyncio.Event().wait()
+
+        # The socket stalls on the first send, so stop has to cancel the loop
+        consumer.send = stalled_send
+
+        await consumer.start_processing()
+        await asyncio.sleep(0.1)
+        await consumer.stop_processing()
+
+        self.assertEqual(consumer.carry_over, b'onetwo')
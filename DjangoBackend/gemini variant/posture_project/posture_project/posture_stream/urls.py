@@ -9,4 +9,6 @@ urlpatterns = [
     path('dashboard/week', views.get_week_data, name='week_data'),
     path('dashboard/month', views.get_month_data, name='month_data'),
     path('logs', views.get_recent_logs, name='recent_logs'),
+    path('analytics/angles', views.get_angle_analytics, name='angle_analytics'),
+    path('stream/metrics', views.get_stream_metrics, name='stream_metrics'),
 ]
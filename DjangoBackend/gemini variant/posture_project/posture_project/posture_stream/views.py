@@ -1,9 +1,23 @@
 from django.http import JsonResponse
 from django.utils import timezone
-from django.db.models import Avg, Sum, Count, Q
+from django.db.models import Sum, Count, Q, F, FloatField
+from django.utils.dateparse import parse_date, parse_datetime
 from datetime import datetime, timedelta
-from .models import PostureLog
+from .admission import get_admission_controller
+from .models import AngleSketch, PostureLog
+from .sketches import DDSketch
 import json
+import math
+
+def weighted_average_angle(logs):
+    """Average angle per logged segment, so compacted rows count as often as the rows they replaced"""
+    totals = logs.aggregate(
+        angle_total=Sum(F('angle') * F('segments'), output_field=FloatField()),
+        segments=Sum('segments')
+    )
+    if not totals['segments']:
+        return None
+    return totals['angle_total'] / totals['segments']
 
 def get_dashboard_stats(request):
     """Get overall dashboard statistics"""
@@ -17,15 +31,15 @@ def get_dashboard_stats(request):
     current_score = latest_log.angle if latest_log else 90
     
     # Get weekly average
-    weekly_avg = PostureLog.objects.filter(
+    weekly_avg = weighted_average_angle(PostureLog.objects.filter(
         timestamp__gte=week_start
-    ).aggregate(Avg('angle'))['angle__avg'] or 90
+    )) or 90
     
     # Get last week's average for comparison
-    last_week_avg = PostureLog.objects.filter(
+    last_week_avg = weighted_average_angle(PostureLog.objects.filter(
         timestamp__gte=last_week_start,
         timestamp__lt=week_start
-    ).aggregate(Avg('angle'))['angle__avg'] or 90
+    )) or 90
     
     weekly_change = round(weekly_avg - last_week_avg, 1)
     
@@ -52,7 +66,7 @@ def get_today_data(request):
                 'time': hour,
                 'good': 0,
                 'poor': 0,
-                'angles': [],
+                'angle_total': 0,
                 'count': 0
             }
         
@@ -61,13 +75,13 @@ def get_today_data(request):
         else:
             hourly_data[hour]['poor'] += log.duration
         
-        hourly_data[hour]['angles'].append(log.angle)
-        hourly_data[hour]['count'] += 1
+        hourly_data[hour]['angle_total'] += log.angle * log.segments
+        hourly_data[hour]['count'] += log.segments
     
     # Calculate average score for each hour
     result = []
     for hour, data in sorted(hourly_data.items()):
-        avg_angle = sum(data['angles']) / len(data['angles']) if data['angles'] else 90
+        avg_angle = data['angle_total'] / data['count'] if data['count'] else 90
         result.append({
             'time': data['time'],
             'good': data['good'],
@@ -92,7 +106,7 @@ def get_week_data(request):
         day_name = day.strftime('%a')  # Mon, Tue, etc.
         daily_data[day_name] = {
             'day': day_name,
-            'angles': [],
+            'angle_total': 0,
             'sessions': 0
         }
     
@@ -100,15 +114,15 @@ def get_week_data(request):
     for log in logs:
         day_name = log.timestamp.strftime('%a')
         if day_name in daily_data:
-            daily_data[day_name]['angles'].append(log.angle)
-            daily_data[day_name]['sessions'] += 1
+            daily_data[day_name]['angle_total'] += log.angle * log.segments
+            daily_data[day_name]['sessions'] += log.segments
     
     # Calculate averages
     result = []
     for day_name in ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']:
         if day_name in daily_data:
             data = daily_data[day_name]
-            avg_score = sum(data['angles']) / len(data['angles']) if data['angles'] else 0
+            avg_score = data['angle_total'] / data['sessions'] if data['sessions'] else 0
             result.append({
                 'day': day_name,
                 'score': round(avg_score, 1) if avg_score > 0 else 0,
@@ -132,17 +146,17 @@ def get_month_data(request):
         if date_str not in daily_data:
             daily_data[date_str] = {
                 'date': date_str,
-                'angles': [],
+                'angle_total': 0,
                 'sessions': 0
             }
         
-        daily_data[date_str]['angles'].append(log.angle)
-        daily_data[date_str]['sessions'] += 1
+        daily_data[date_str]['angle_total'] += log.angle * log.segments
+        daily_data[date_str]['sessions'] += log.segments
     
     # Calculate averages
     result = []
     for date_str, data in sorted(daily_data.items()):
-        avg_score = sum(data['angles']) / len(data['angles']) if data['angles'] else 90
+        avg_score = data['angle_total'] / data['sessions'] if data['sessions'] else 90
         result.append({
             'date': date_str,
             'score': round(avg_score, 1),
@@ -159,13 +173,132 @@ def get_recent_logs(request):
     
     data = []
     for log in logs:
+        # Compacted rows hold a weighted average angle
+        angle = round(log.angle, 1)
         data.append({
             '_id': str(log.id),
             'timestamp': log.timestamp.isoformat(),
             'postureType': log.posture_status,
-            'angle': log.angle,
+            'angle': angle,
             'duration': log.duration,
-            'notes': f"{log.angle}° for {log.duration}s"
+            'notes': f"{angle}° for {log.duration}s"
         })
     
     return JsonResponse({'data': data})
+
+ANALYTICS_GRANULARITIES = ('hour', 'day', 'week', 'month')
+# Shortest length of each period, used to bound how many a range can span
+ANALYTICS_PERIOD_LENGTHS = {
+    'hour': timedelta(hours=1),
+    'day': timedelta(days=1),
+    'week': timedelta(weeks=1),
+    'month': timedelta(days=28),
+}
+ANALYTICS_MAX_BINS = 360
+ANALYTICS_MAX_PERIODS = 1000
+
+def _parse_bound(value):
+    """Parse an ISO date or datetime query parameter into an aware datetime"""
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f"Invalid date: {value}")
+        parsed = datetime.combine(day, datetime.min.time())
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+def _period_start(bucket_start, granularity):
+    """Return the start of the reporting period containing an hourly bucket"""
+    local = timezone.localtime(bucket_start)
+    if granularity == 'hour':
+        return local
+    day = local.replace(hour=0)
+    if granularity == 'day':
+        return day
+    if granularity == 'week':
+        return day - timedelta(days=day.weekday())
+    return day.replace(day=1)
+
+def _summarize(sketch, percentiles, edges):
+    """Build the JSON summary for one merged sketch"""
+    histogram = sketch.histogram(edges)
+    return {
+        'count': sketch.count,
+        'mean': round(sketch.mean, 1) if sketch.count else None,
+        'percentiles': {
+            f"p{p:g}": round(sketch.quantile(p / 100), 1) if sketch.count else None
+            for p in percentiles
+        },
+        'histogram': [
+            {'start': edges[i], 'end': edges[i + 1], 'count': histogram[i]}
+            for i in range(len(histogram))
+        ]
+    }
+
+def get_angle_analytics(request):
+    """
+    Get angle percentiles and histograms over a time range.
+    Query params: start, end (ISO date/datetime, default last 7 days),
+    granularity (hour/day/week/month), percentiles (e.g. 50,90) and bin_width.
+    """
+    now = timezone.now()
+    try:
+        end = _parse_bound(request.GET['end']) if 'end' in request.GET else now
+        start = _parse_bound(request.GET['start']) if 'start' in request.GET else end - timedelta(days=7)
+        percentiles = [float(p) for p in request.GET.get('percentiles', '50,90').split(',')]
+        bin_width = float(request.GET.get('bin_width', 10))
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    granularity = request.GET.get('granularity', 'day')
+    if granularity not in ANALYTICS_GRANULARITIES:
+        return JsonResponse({'error': f"granularity must be one of {', '.join(ANALYTICS_GRANULARITIES)}"}, status=400)
+    # float() accepts nan and inf, which would end up in the JSON response
+    if not all(math.isfinite(value) for value in percentiles + [bin_width]):
+        return JsonResponse({'error': 'percentiles and bin_width must be finite numbers'}, status=400)
+    if any(p < 0 or p > 100 for p in percentiles):
+        return JsonResponse({'error': 'percentiles must be between 0 and 100'}, status=400)
+    if bin_width <= 0:
+        return JsonResponse({'error': 'bin_width must be positive'}, status=400)
+    if 180 / bin_width > ANALYTICS_MAX_BINS:
+        return JsonResponse({'error': f"bin_width must be at least {180 / ANALYTICS_MAX_BINS:g}"}, status=400)
+    if (end - start) / ANALYTICS_PERIOD_LENGTHS[granularity] > ANALYTICS_MAX_PERIODS:
+        return JsonResponse({'error': f"Range spans more than {ANALYTICS_MAX_PERIODS} {granularity} periods, use a coarser granularity"}, status=400)
+    
+    edges = [0.0]
+    while edges[-1] < 180:
+        edges.append(min(edges[-1] + bin_width, 180.0))
+    
+    # Buckets are hourly, so a partial first hour is included whole
+    buckets = AngleSketch.objects.filter(
+        bucket_start__gte=AngleSketch.bucket_for(start),
+        bucket_start__lt=end
+    ).order_by('bucket_start')
+    
+    periods = {}
+    overall = DDSketch()
+    for bucket in buckets.iterator():
+        sketch = DDSketch.from_dict(bucket.sketch)
+        period = _period_start(bucket.bucket_start, granularity)
+        periods.setdefault(period, DDSketch()).merge(sketch)
+        overall.merge(sketch)
+    
+    result = []
+    for period, sketch in sorted(periods.items()):
+        summary = _summarize(sketch, percentiles, edges)
+        summary['period'] = period.isoformat()
+        result.append(summary)
+    
+    return JsonResponse({
+        'granularity': granularity,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'overall': _summarize(overall, percentiles, edges),
+        'data': result
+    })
+
+def get_stream_metrics(request):
+    """Get live streaming session and CPU metrics for this process"""
+    return JsonResponse(get_admission_controller().metrics())
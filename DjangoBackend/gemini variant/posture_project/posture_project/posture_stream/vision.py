@@ -0,0 +1,178 @@
+"""
+Pose detection helpers shared by the WebSocket consumer and management commands
+"""
+import cv2
+import mediapipe as mp
+import numpy as np
+
+mp_pose = mp.solutions.pose
+
+
+def calculate_angle(a, b, c):
+    """Calculate angle between three points"""
+    a = np.array(a)
+    b = np.array(b)
+    c = np.array(c)
+
+    ba = a - b
+    bc = c - b
+
+    cosine_angle = np.dot(ba, bc) / (np.linalg.norm(ba) * np.linalg.norm(bc))
+    angle = np.arccos(cosine_angle)
+    angle_degrees = np.degrees(angle)
+
+    if angle_degrees > 180.0:
+        angle_degrees = 360 - angle_degrees
+
+    return angle_degrees
+
+
+def hip_points(landmarks):
+    """Return the left shoulder, hip and knee as normalized [x, y] pairs"""
+    points = []
+    for part in (mp_pose.PoseLandmark.LEFT_SHOULDER,
+                 mp_pose.PoseLandmark.LEFT_HIP,
+                 mp_pose.PoseLandmark.LEFT_KNEE):
+        landmark = landmarks[part.value]
+        points.append([landmark.x, landmark.y])
+    return points
+
+
+def landmarks_bbox(landmarks, image_width, image_height, padding=0.25, min_visibility=0.5):
+    """
+    Return a padded (x0, y0, x1, y1) pixel box around the landmarks,
+    clipped to the image, or None if no usable landmarks are present
+    """
+    visible = [lm for lm in landmarks if lm.visibility >= min_visibility]
+    if not visible:
+        visible = list(landmarks)
+    if not visible:
+        return None
+
+    xs = np.clip([lm.x for lm in visible], 0.0, 1.0) * image_width
+    ys = np.clip([lm.y for lm in visible], 0.0, 1.0) * image_height
+    x0, x1 = xs.min(), xs.max()
+    y0, y1 = ys.min(), ys.max()
+
+    # Pad relative to the larger side so a thin pose still gets a usable box
+    pad = max(x1 - x0, y1 - y0) * padding
+    x0 = int(max(0, x0 - pad))
+    y0 = int(max(0, y0 - pad))
+    x1 = int(min(image_width, np.ceil(x1 + pad)))
+    y1 = int(min(image_height, np.ceil(y1 + pad)))
+
+    if x1 - x0 < 2 or y1 - y0 < 2:
+        return None
+    return x0, y0, x1, y1
+
+
+def remap_landmarks(landmarks, bbox, image_width, image_height):
+    """Convert landmarks normalized to a crop back to full-frame coordinates in place"""
+    x0, y0, x1, y1 = bbox
+    crop_width = x1 - x0
+    crop_height = y1 - y0
+    for lm in landmarks:
+        lm.x = (lm.x * crop_width + x0) / image_width
+        lm.y = (lm.y * crop_height + y0) / image_height
+        # z uses roughly the same scale as x
+        lm.z = lm.z * crop_width / image_width
+
+
+def box_contains(outer, inner):
+    """Return True if the (x0, y0, x1, y1) box inner lies inside outer"""
+    return (outer[0] <= inner[0] and outer[1] <= inner[1]
+            and inner[2] <= outer[2] and inner[3] <= outer[3])
+
+
+class PoseDetector:
+    """
+    MediaPipe Pose wrapper with optional region-of-interest inference.
+
+    With ROI enabled, frames are cropped to a padded box around the
+    person's landmarks and downscaled to at most ``roi_max_side`` pixels
+    before inference. Landmarks are remapped to full-frame coordinates, so
+    callers see the same results as full-frame detection.
+
+    MediaPipe keeps its tracking box and landmark smoothing in the
+    normalized coordinates of the previous input, so crops go to their own
+    Pose instance with smoothing off. The crop stays fixed while the person
+    stays inside it. When the person nears its edge the crop is moved and
+    the crop instance is recreated, so no state carries across framings.
+    When the person is lost inside the crop, the same frame is re-run on
+    the full-frame instance.
+    """
+
+    def __init__(self, roi_enabled=False, roi_padding=0.25, roi_max_side=480,
+                 min_detection_confidence=0.5, min_tracking_confidence=0.5):
+        self.min_detection_confidence = min_detection_confidence
+        self.min_tracking_confidence = min_tracking_confidence
+        self.pose = mp_pose.Pose(
+            min_detection_confidence=min_detection_confidence,
+            min_tracking_confidence=min_tracking_confidence
+        )
+        self.crop_pose = None
+        self.roi_enabled = roi_enabled
+        self.roi_padding = roi_padding
+        self.roi_max_side = roi_max_side
+        self.roi = None
+        self.used_roi = False
+        self.crop_resets = 0
+
+    def _set_roi(self, roi):
+        """Move the crop, dropping the crop instance's state if the framing changes"""
+        if roi != self.roi and self.crop_pose is not None:
+            self.crop_pose.close()
+            self.crop_pose = None
+        self.roi = roi
+
+    def _crop(self, image_rgb):
+        x0, y0, x1, y1 = self.roi
+        crop = image_rgb[y0:y1, x0:x1]
+        crop_height, crop_width = crop.shape[:2]
+        scale = self.roi_max_side / max(crop_height, crop_width)
+        if scale < 1:
+            size = (max(1, int(crop_width * scale)), max(1, int(crop_height * scale)))
+            return cv2.resize(crop, size, interpolation=cv2.INTER_AREA)
+        return np.ascontiguousarray(crop)
+
+    def process(self, image_rgb):
+        """Run pose detection on an RGB frame and return MediaPipe results"""
+        image_height, image_width = image_rgb.shape[:2]
+
+        if self.roi_enabled and self.roi is not None:
+            if self.crop_pose is None:
+                self.crop_pose = mp_pose.Pose(
+                    smooth_landmarks=False,
+                    min_detection_confidence=self.min_detection_confidence,
+                    min_tracking_confidence=self.min_tracking_confidence
+                )
+                self.crop_resets += 1
+            results = self.crop_pose.process(self._crop(image_rgb))
+            if results.pose_landmarks:
+                landmarks = results.pose_landmarks.landmark
+                remap_landmarks(landmarks, self.roi, image_width, image_height)
+                # Keep the crop while the person stays clear of its edges
+                inner = landmarks_bbox(landmarks, image_width, image_height, self.roi_padding / 2)
+                if inner is None or not box_contains(self.roi, inner):
+                    self._set_roi(landmarks_bbox(landmarks, image_width, image_height, self.roi_padding))
+                self.used_roi = True
+                return results
+            # Person lost inside the crop, fall back to full-frame detection
+            self._set_roi(None)
+
+        results = self.pose.process(image_rgb)
+        self.used_roi = False
+        if self.roi_enabled:
+            if results.pose_landmarks:
+                self._set_roi(landmarks_bbox(
+                    results.pose_landmarks.landmark, image_width, image_height, self.roi_padding
+                ))
+            else:
+                self._set_roi(None)
+        return results
+
+    def close(self):
+        self.pose.close()
+        if self.crop_pose is not None:
+            self.crop_pose.close()
+            self.crop_pose = None
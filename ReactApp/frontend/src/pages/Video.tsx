@@ -6,6 +6,9 @@ import { StatusBadge } from "@/components/ui/status-badge";
 import { Switch } from "@/components/ui/switch";
 import { Label } from "@/components/ui/label";
 
+// Open the page with ?mode=video to receive H.264/VP8 instead of one JPEG per frame
+const STREAM_MODE = new URLSearchParams(window.location.search).get('mode') === 'video' ? 'video' : 'mjpeg';
+
 export default function Video() {
   const [isStreaming, setIsStreaming] = useState(false);
   const [isConnected, setIsConnected] = useState(false);
@@ -17,11 +20,79 @@ export default function Video() {
   const [postureAngle, setPostureAngle] = useState(0);
   const [frame, setFrame] = useState<string | null>(null);
   const [cameraError, setCameraError] = useState<string>("");
+  const [sessionMode, setSessionMode] = useState<"full" | "degraded" | null>(null);
   
   const wsRef = useRef<WebSocket | null>(null);
   const audioCtxRef = useRef<AudioContext | null>(null);
   const alertIntervalRef = useRef<number | null>(null);
 
+  // Media Source Extensions state for video mode
+  const [videoActive, setVideoActive] = useState(false);
+  const videoRef = useRef<HTMLVideoElement | null>(null);
+  const mediaSourceRef = useRef<MediaSource | null>(null);
+  const sourceBufferRef = useRef<SourceBuffer | null>(null);
+  const chunkQueueRef = useRef<ArrayBuffer[]>([]);
+  const videoFailedRef = useRef(false);
+
+  // Append queued video chunks in order, one at a time
+  const appendNextChunk = () => {
+    const sourceBuffer = sourceBufferRef.current;
+    if (!sourceBuffer || sourceBuffer.updating) return;
+
+    // Keep the buffer short so a long session doesn't fill up memory
+    const video = videoRef.current;
+    if (video && sourceBuffer.buffered.length && video.currentTime - sourceBuffer.buffered.start(0) > 30) {
+      sourceBuffer.remove(0, video.currentTime - 10);
+      return;
+    }
+
+    const chunk = chunkQueueRef.current.shift();
+    if (chunk) {
+      try {
+        sourceBuffer.appendBuffer(chunk);
+      } catch (e) {
+        console.error('Error appending video chunk:', e);
+      }
+    }
+  };
+
+  // Create the SourceBuffer once the stream's MIME type is known
+  const startVideo = (mimeType: string) => {
+    if (mediaSourceRef.current || videoFailedRef.current || !videoRef.current) return;
+    if (!window.MediaSource || !MediaSource.isTypeSupported(mimeType)) {
+      console.error(`Video stream format not supported: ${mimeType}`);
+      setCameraError("This browser cannot play the video stream. Open the page without ?mode=video.");
+      videoFailedRef.current = true;
+      chunkQueueRef.current = [];
+      return;
+    }
+
+    const mediaSource = new MediaSource();
+    mediaSourceRef.current = mediaSource;
+    mediaSource.addEventListener('sourceopen', () => {
+      const sourceBuffer = mediaSource.addSourceBuffer(mimeType);
+      sourceBuffer.mode = 'sequence';
+      sourceBuffer.addEventListener('updateend', appendNextChunk);
+      sourceBufferRef.current = sourceBuffer;
+      appendNextChunk();
+    }, { once: true });
+    videoRef.current.src = URL.createObjectURL(mediaSource);
+    videoRef.current.play().catch(() => {});
+    setVideoActive(true);
+  };
+
+  const resetVideo = () => {
+    if (videoRef.current?.src) {
+      URL.revokeObjectURL(videoRef.current.src);
+      videoRef.current.removeAttribute('src');
+    }
+    mediaSourceRef.current = null;
+    sourceBufferRef.current = null;
+    chunkQueueRef.current = [];
+    videoFailedRef.current = false;
+    setVideoActive(false);
+  };
+
   // Request camera permission
   const requestCameraPermission = async () => {
     try {
@@ -45,7 +116,10 @@ export default function Video() {
 
   // Connect to Django WebSocket
   const connectWebSocket = () => {
-    const ws = new WebSocket('ws://localhost:8000/ws/posture/');
+    const ws = new WebSocket(`ws://localhost:8000/ws/posture/${STREAM_MODE === 'video' ? '?mode=video' : ''}`);
+    // A new connection starts a new video stream with its own init segment
+    ws.binaryType = 'arraybuffer';
+    resetVideo();
     
     ws.onopen = () => {
       console.log('WebSocket Connected to Django Backend');
@@ -53,11 +127,32 @@ export default function Video() {
     };
 
     ws.onmessage = (event) => {
+      // Binary messages are video chunks, posture data always arrives as text
+      if (typeof event.data !== 'string') {
+        if (videoFailedRef.current) return;
+        chunkQueueRef.current.push(event.data);
+        appendNextChunk();
+        return;
+      }
+
       const data = JSON.parse(event.data);
       
+      // Admission result, sent once before any frames
+      if (data.error) {
+        setCameraError(data.error);
+        return;
+      }
+      if (data.status === 'admitted') {
+        setCameraError("");
+        setSessionMode(data.mode);
+        return;
+      }
+      
       // Update frame
       if (data.frame) {
-        setFrame(`data:image/jpeg;base64,${data.frame}`);
+        setFrame(`data:${data.format || 'image/jpeg'};base64,${data.frame}`);
+      } else if (data.format?.startsWith('video/')) {
+        startVideo(data.format);
       }
       
       // Update posture data
@@ -86,10 +181,17 @@ export default function Video() {
       setIsConnected(false);
     };
 
-    ws.onclose = () => {
+    ws.onclose = (event) => {
       console.log('WebSocket Disconnected');
       setIsConnected(false);
       setIsStreaming(false);
+      setSessionMode(null);
+      
+      // 1013: the server is at capacity, so don't keep retrying
+      if (event.code === 1013) {
+        setCameraError("The server is busy with other sessions. Please try again later.");
+        return;
+      }
       
       // Attempt to reconnect after 3 seconds if camera permission is still granted
       if (cameraPermissionGranted) {
@@ -134,6 +236,7 @@ export default function Video() {
     setIsConnected(false);
     setCameraPermissionGranted(false);
     setFrame(null);
+    resetVideo();
     setPostureAngle(0);
     setPostureStatus('good');
     wsRef.current = null;
@@ -267,7 +370,16 @@ export default function Video() {
             </CardHeader>
             <CardContent>
               <div className="relative bg-muted rounded-lg overflow-hidden aspect-video">
-                {frame ? (
+                {STREAM_MODE === 'video' && (
+                  <video
+                    ref={videoRef}
+                    autoPlay
+                    muted
+                    playsInline
+                    className={videoActive ? "w-full h-full object-contain" : "hidden"}
+                  />
+                )}
+                {videoActive ? null : frame ? (
                   <img 
                     src={frame} 
                     alt="Posture Detection Feed" 
@@ -383,6 +495,11 @@ export default function Video() {
                   {isConnected ? 'Connected to Backend' : 'Disconnected'}
                 </span>
               </div>
+              {sessionMode === 'degraded' && (
+                <p className="text-sm text-warning">
+                  Server is busy, streaming at a reduced frame rate
+                </p>
+              )}
               {!cameraPermissionGranted && (
                 <div className="pt-4 border-t">
                   <p className="text-sm text-muted-foreground">